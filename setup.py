@@ -16,6 +16,7 @@ setup(
     author_email='simon.pfreundschuh@chalmers.se',  # Optional
     install_requires=[
         "tqdm",
+        "scipy",
     ],
     packages=["wxdata"],
     python_requires='>=3.6',
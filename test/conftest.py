@@ -0,0 +1,62 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+def granule_name(start, product="2B-GEOPROF"):
+    """
+    Name of a CloudSat granule starting on the day of start.
+    """
+    return "{:%Y%j%H%M%S}_00001_CS_{}_GRANULE_P_R04_E03.hdf".format(start,
+                                                                     product)
+
+def write_granule(filename, start, n_profiles=20, n_bins=8, lon_0=0.0):
+    """
+    Write a synthetic CloudSat 2B-GEOPROF granule.
+
+    Profiles are one minute apart and start at start. The ground track
+    runs diagonally from :code:`(lon_0, -10)` to :code:`(lon_0 + 20, 10)`.
+    """
+    from pyhdf.HDF import HDF, HC
+    from pyhdf.SD import SD, SDC
+    import pyhdf.VS
+
+    sd = SD(filename, SDC.WRITE | SDC.CREATE)
+    dataset = sd.create("Radar_Reflectivity", SDC.INT16, (n_profiles, n_bins))
+    data = np.arange(n_profiles * n_bins).reshape(n_profiles, n_bins)
+    dataset[:] = (100 * (data % 50)).astype(np.int16)
+    dataset.endaccess()
+    sd.end()
+
+    hdf = HDF(filename, HC.WRITE)
+    vs = hdf.vstart()
+    def vdata(name, values):
+        vd = vs.create(name, [("value", HC.FLOAT32, 1)])
+        vd.write([[float(v)] for v in values])
+        vd.detach()
+    date = datetime(start.year, start.month, start.day)
+    vdata("UTC_start", [(start - date).total_seconds()])
+    vdata("Profile_time", np.arange(n_profiles) * 60.0)
+    vdata("Latitude", np.linspace(-10, 10, n_profiles))
+    vdata("Longitude", np.linspace(lon_0, lon_0 + 20, n_profiles))
+    vs.end()
+    hdf.close()
+    return filename
+
+@pytest.fixture
+def granules(tmp_path):
+    """
+    Folder containing three consecutive granules, whose first profiles
+    are 30 seconds later than the time in their filenames.
+    """
+    pytest.importorskip("pyhdf")
+    filenames = []
+    for i in range(3):
+        t = datetime(2010, 1, 1) + i * timedelta(minutes=30)
+        folder = tmp_path / "{:02d}".format(i)
+        folder.mkdir()
+        filename = str(folder / granule_name(t))
+        write_granule(filename, t + timedelta(seconds=30))
+        filenames.append(filename)
+    return tmp_path, filenames
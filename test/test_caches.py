@@ -0,0 +1,139 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import wxdata.index.transcode
+from wxdata.index.transcode import TranscodeCache
+from wxdata.products import CloudSat_2b_GeoProf
+
+################################################################################
+# Transcode cache
+################################################################################
+
+def test_transcode_cache(granules, tmp_path):
+    path, filenames = granules
+    cache = TranscodeCache(str(tmp_path / "cache"))
+    open_file = lambda: CloudSat_2b_GeoProf(filenames[0])
+
+    source = open_file()
+    expected = source.radar_reflectivity
+    start_time = source.start_time
+    source.close()
+
+    for i in range(2):
+        file = cache.get(filenames[0], "CloudSat_2b_GeoProf", open_file)
+        assert isinstance(file.radar_reflectivity, np.ma.MaskedArray)
+        assert (file.radar_reflectivity == expected).all()
+        assert (np.ma.getmaskarray(file.radar_reflectivity) ==
+                np.ma.getmaskarray(expected)).all()
+        assert file.start_time == start_time
+        file.close()
+    assert cache.stats["misses"] == 1
+    assert cache.stats["hits"] == 1
+
+    # Modified files are transcoded again.
+    os.utime(filenames[0], ns=(0, 0))
+    cache.get(filenames[0], "CloudSat_2b_GeoProf", open_file).close()
+    assert cache.stats["misses"] == 2
+
+def test_transcode_cache_eviction(granules, tmp_path):
+    path, filenames = granules
+    cache = TranscodeCache(str(tmp_path / "cache"), max_bytes=1)
+    for f in filenames:
+        file = cache.get(f, "CloudSat_2b_GeoProf",
+                         lambda: CloudSat_2b_GeoProf(f))
+        # Fields remain valid after the entry was evicted.
+        assert file.radar_reflectivity.shape == (20, 8)
+        file.close()
+    entries = [e for e in os.listdir(tmp_path / "cache")
+               if not e.startswith(".")]
+    assert len(entries) == 1
+    assert cache.stats["evictions"] == 2
+
+def test_transcode_cache_retries_are_limited(granules, tmp_path, monkeypatch):
+    path, filenames = granules
+    cache = TranscodeCache(str(tmp_path / "cache"), retries=2)
+    attempts = []
+    def transcoded_file(*args):
+        attempts.append(args)
+        raise FileNotFoundError("Entry was removed.")
+    monkeypatch.setattr(wxdata.index.transcode, "TranscodedFile",
+                        transcoded_file)
+    with pytest.raises(FileNotFoundError):
+        cache.get(filenames[0], "CloudSat_2b_GeoProf",
+                  lambda: CloudSat_2b_GeoProf(filenames[0]))
+    assert len(attempts) == 3
+
+################################################################################
+# Handle cache
+################################################################################
+
+def test_handle_cache(granules):
+    from wxdata.index.cache import HandleCache
+
+    path, filenames = granules
+    cache = HandleCache(max_handles=2)
+    opened = [cache.get(f, lambda f=f: CloudSat_2b_GeoProf(f))
+              for f in filenames]
+    # The least recently used file was closed when it was evicted.
+    assert opened[0].closed
+    assert not opened[2].closed
+    assert cache.get(filenames[2], None) is opened[2]
+    assert cache.stats == {"hits": 1, "misses": 3, "evictions": 1,
+                           "handles": 2, "bytes": cache.stats["bytes"]}
+
+    # Closed files are opened again.
+    opened[2].close()
+    reopened = cache.get(filenames[2],
+                         lambda: CloudSat_2b_GeoProf(filenames[2]))
+    assert not reopened is opened[2]
+    cache.clear()
+    assert reopened.closed
+    assert len(cache) == 0
+
+    with pytest.raises(ValueError):
+        HandleCache(max_handles=0)
+
+################################################################################
+# Field cache
+################################################################################
+
+def test_field_cache(granules, monkeypatch):
+    from wxdata.products.common import field_cache
+
+    path, filenames = granules
+    field_cache.clear()
+    monkeypatch.setattr(field_cache, "max_bytes", 2 ** 20)
+    file = CloudSat_2b_GeoProf(filenames[0])
+    other = CloudSat_2b_GeoProf(filenames[0])
+    data = file.radar_reflectivity
+    # Fields are shared between files opened from the same path.
+    assert other.radar_reflectivity is data
+    # Views only share fields with views of the same profiles.
+    assert file.profiles[2:5].radar_reflectivity.shape == (3, 8)
+    assert field_cache.stats["fields"] == 2
+
+    other.close()
+    assert field_cache.stats["fields"] == 0
+    assert not file.radar_reflectivity is data
+    file.close()
+
+def test_field_cache_budget(granules, monkeypatch):
+    from wxdata.products.common import field_cache
+
+    path, filenames = granules
+    field_cache.clear()
+    file = CloudSat_2b_GeoProf(filenames[0])
+    size = file.radar_reflectivity.nbytes + file.radar_reflectivity.mask.nbytes
+    monkeypatch.setattr(field_cache, "max_bytes", size)
+    evictions = field_cache.stats["evictions"]
+    files = [CloudSat_2b_GeoProf(f) for f in filenames[:2]]
+    for f in files:
+        f.radar_reflectivity
+    assert field_cache.stats["fields"] == 1
+    assert field_cache.stats["evictions"] == evictions + 1
+    for f in files + [file]:
+        f.close()
+    field_cache.clear()
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from wxdata.products import CloudSat_2b_GeoProf, CloudSat_Modis_Aux
+from conftest import granule_name
+
+def test_select_profiles(granules):
+    path, filenames = granules
+    file = CloudSat_2b_GeoProf(filenames[0])
+    full = file.radar_reflectivity
+    view = file.select(profiles=(5, 10))
+    assert (view.radar_reflectivity == full[5:10]).all()
+    assert (view.latitude == file.latitude[5:10]).all()
+    assert (file.profiles[-1].radar_reflectivity == full[-1:]).all()
+    # Selections of views are relative to the view.
+    assert (view.profiles[1:3].radar_reflectivity == full[6:8]).all()
+    # Tuples are interpreted like slices.
+    assert (file.select(profiles=(0, -1)).radar_reflectivity ==
+            full[:-1]).all()
+    assert (view.select(profiles=(-2, None)).radar_reflectivity ==
+            full[8:10]).all()
+    with pytest.raises(ValueError):
+        file.select(profiles=(10, 5))
+    file.close()
+
+def test_select_time(granules):
+    path, filenames = granules
+    file = CloudSat_2b_GeoProf(filenames[0])
+    t0 = file.start_time + timedelta(minutes=2)
+    view = file.select(time=(t0, t0 + timedelta(minutes=3)))
+    times = view.profile_times
+    assert len(times) == 3
+    assert times[0] == np.datetime64(t0, "ms")
+    assert (view.radar_reflectivity ==
+            file.radar_reflectivity[2:5]).all()
+    file.close()
+
+def test_profile_times(granules):
+    path, filenames = granules
+    file = CloudSat_2b_GeoProf(filenames[0])
+    times = file.profile_times
+    assert times[0] == np.datetime64(file.start_time, "ms")
+    assert times[-1] == np.datetime64(file.end_time, "ms")
+    file.close()
+
+def write_modis_granule(filename):
+    """
+    Write emissivities of three channels for five profiles of four pixels
+    from two MODIS granules. One pixel has a missing granule index and
+    one offset and one scale are missing.
+    """
+    from pyhdf.SD import SD, SDC
+
+    sd = SD(filename, SDC.WRITE | SDC.CREATE)
+    def dataset(name, type, values):
+        d = sd.create(name, type, values.shape)
+        d[:] = values
+        d.endaccess()
+    raw = np.arange(3 * 4 * 5).reshape(3, 4, 5) * 1000
+    dataset("EV_1KM_Emissive", SDC.UINT16, raw.astype(np.uint16))
+    indices = np.arange(4 * 5).reshape(4, 5) % 2
+    indices[2, 3] = -99
+    dataset("MODIS_granule_index", SDC.INT32, indices.astype(np.int32))
+    offsets = np.array([[1.0, 2.0], [-999, 3.0], [4.0, 5.0]])
+    scales = np.array([[0.5, 0.25], [0.1, 0.2], [0.3, -999]])
+    dataset("EV_1KM_Emissive_rad_offsets", SDC.FLOAT32,
+            offsets.astype(np.float32))
+    dataset("EV_1KM_Emissive_rad_scales", SDC.FLOAT32,
+            scales.astype(np.float32))
+    sd.end()
+    return filename
+
+def emissivity_per_channel(filename):
+    """
+    Emissivities scaled one profile at a time.
+    """
+    from pyhdf.SD import SD
+
+    sd = SD(filename)
+    raw = sd.select("EV_1KM_Emissive")[:]
+    all_indices = sd.select("MODIS_granule_index")[:]
+    all_offsets = sd.select("EV_1KM_Emissive_rad_offsets")[:]
+    all_scales = sd.select("EV_1KM_Emissive_rad_scales")[:]
+    sd.end()
+
+    data = np.float32(raw)
+    mask = raw >= 32768
+    for i in range(data.shape[-1]):
+        granule_indices = all_indices[:, i]
+        mask[:, :, i] += granule_indices == -99
+        if min(granule_indices) < 0:
+            offsets = -999
+            scales = -999
+        else:
+            offsets = all_offsets[:, granule_indices]
+            scales = all_scales[:, granule_indices]
+        mask[:, :, i] += offsets == -999
+        mask[:, :, i] += scales == -999
+        data[:, :, i] -= offsets
+        data[:, :, i] *= scales
+    return np.ma.masked_array(data, mask=mask)
+
+def test_emissivity_channels(tmp_path):
+    pytest.importorskip("pyhdf")
+
+    t = datetime(2010, 1, 1)
+    filename = str(tmp_path / granule_name(t, "MODIS-AUX"))
+    write_modis_granule(filename)
+    expected = emissivity_per_channel(filename)
+
+    file = CloudSat_Modis_Aux(filename)
+    emissivity = file.get_emissivity_channels()
+    assert (emissivity.mask == expected.mask).all()
+    assert emissivity.mask.any()
+    assert np.allclose(emissivity.compressed(), expected.compressed())
+
+    selected = file.get_emissivity_channels(channels=[2, 0])
+    assert (selected.mask == emissivity.mask[[2, 0]]).all()
+    assert np.allclose(selected.compressed(),
+                       emissivity[[2, 0]].compressed())
+    file.close()
+
+def test_decode_into_buffers(granules):
+    path, filenames = granules
+    file = CloudSat_2b_GeoProf(filenames[0])
+    expected = file.radar_reflectivity
+    n, m = expected.shape
+    out = np.zeros((2 * n, m), dtype=np.float32)
+    mask_out = np.zeros((2 * n, m), dtype=np.bool_)
+    data = file.get_radar_reflectivity(out=out[:n], mask_out=mask_out[:n])
+    assert np.shares_memory(data.data, out)
+    assert np.shares_memory(data.mask, mask_out)
+    assert (data == expected).all()
+    assert (data.mask == expected.mask).all()
+    with pytest.raises(ValueError):
+        file.get_radar_reflectivity(out=out)
+    file.close()
+
+def test_compact_fields(granules):
+    path, filenames = granules
+    file = CloudSat_2b_GeoProf(filenames[0])
+    expected = file.radar_reflectivity
+    compact = file.get_radar_reflectivity(compact=True)
+    data = compact.decode()
+    assert (data.data == expected.data).all()
+    assert (data.mask == expected.mask).all()
+    data = compact[5:10].decode()
+    assert (data.data == expected.data[5:10]).all()
+    assert (data.mask == expected.mask[5:10]).all()
+    file.close()
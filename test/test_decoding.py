@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from wxdata.products.decoding import ScaledArray, decode
+
+RAW = np.array([[-9999, 0, 1000], [2500, 6000, -8888]], dtype=np.int16)
+PARAMETERS = {"factor": 100.0, "fill_max": -8888, "valid_range": (-40, 50)}
+
+def test_decode():
+    data = decode(RAW, **PARAMETERS)
+    assert data.dtype == np.float32
+    assert (data.mask == [[True, False, False], [False, False, True]]).all()
+    assert (data.compressed() == [0.0, 10.0, 25.0, 50.0]).all()
+
+    data = decode(RAW, offset=1000, fill_value=0)
+    assert (data.mask == (RAW == 0)).all()
+    assert data[0, 2] == 0.0
+
+def test_decode_into_buffers():
+    out = np.zeros((4, 3), dtype=np.float32)
+    mask = np.zeros((4, 3), dtype=np.bool_)
+    data = decode(RAW, out=out[:2], mask_out=mask[:2], **PARAMETERS)
+    assert np.shares_memory(data.data, out)
+    assert np.shares_memory(data.mask, mask)
+    assert (data == decode(RAW, **PARAMETERS)).all()
+    with pytest.raises(ValueError):
+        decode(RAW, out=out, **PARAMETERS)
+    with pytest.raises(ValueError):
+        decode(RAW, mask_out=mask, **PARAMETERS)
+
+def test_scaled_array():
+    expected = decode(RAW, **PARAMETERS)
+    compact = ScaledArray(RAW, **PARAMETERS)
+    assert compact.shape == RAW.shape
+    assert len(compact) == 2
+    data = compact.decode()
+    assert (data.mask == expected.mask).all()
+    assert (data.data == expected.data).all()
+
+    data = compact[1:, 1:].decode()
+    assert (data.mask == expected.mask[1:, 1:]).all()
+    assert (data.data == expected.data[1:, 1:]).all()
+    assert (np.asarray(compact[0]) == expected.data[0]).all()
@@ -0,0 +1,71 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from wxdata.download.__main__ import queue_files
+from wxdata.download.scheduler import DownloadScheduler
+from wxdata.products import CloudSat_2b_GeoProf
+
+def granule(t):
+    return "{:%Y%j%H%M%S}_00001_CS_2B-GEOPROF_GRANULE_P_R04_E03.hdf".format(t)
+
+class FakeProvider:
+    """
+    Provider listing one granule every twelve hours.
+    """
+    product = CloudSat_2b_GeoProf
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.downloads = []
+
+    def get_files_in_range(self, t0, t1):
+        # Like DataProvider.get_files_in_range, the listing includes the
+        # first file starting after the end of the range.
+        files = []
+        t = t0
+        while t <= t1:
+            files += [granule(t)]
+            t += timedelta(hours=12)
+        return files
+
+    def download(self, filename, dest):
+        self.downloads += [filename]
+        if filename in self.fail:
+            raise OSError("Download failed.")
+        with open(dest, "w") as f:
+            f.write(filename)
+
+def test_files_are_stored_in_folder_of_their_day(tmp_path):
+    provider = FakeProvider()
+    scheduler = DownloadScheduler(max_concurrent=2)
+    days = [datetime(2010, 1, 1), datetime(2010, 1, 2)]
+    queue_files(scheduler, provider, days, str(tmp_path))
+    assert scheduler.run() == []
+
+    first = sorted(os.listdir(tmp_path / "2010" / "01" / "01"))
+    second = sorted(os.listdir(tmp_path / "2010" / "01" / "02"))
+    assert first == [granule(datetime(2010, 1, 1)),
+                     granule(datetime(2010, 1, 1, 12))]
+    assert second == [granule(datetime(2010, 1, 2)),
+                      granule(datetime(2010, 1, 2, 12))]
+    assert sorted(provider.downloads) == sorted(set(provider.downloads))
+
+def test_add_keeps_different_destinations(tmp_path):
+    provider = FakeProvider()
+    scheduler = DownloadScheduler()
+    f = granule(datetime(2010, 1, 1))
+    scheduler.add(provider, f, str(tmp_path / "a" / f))
+    scheduler.add(provider, f, str(tmp_path / "a" / f))
+    scheduler.add(provider, f, str(tmp_path / "b" / f))
+    assert len(scheduler) == 2
+
+def test_failed_downloads_are_reported(tmp_path):
+    f = granule(datetime(2010, 1, 1))
+    provider = FakeProvider(fail=[f])
+    scheduler = DownloadScheduler()
+    scheduler.add(provider, f, str(tmp_path / f))
+    failed = scheduler.run()
+    assert [name for name, _ in failed] == [f]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,89 @@
+import os
+import threading
+
+import pytest
+
+from wxdata.download.ftp import FtpPool
+
+pyftpdlib = pytest.importorskip("pyftpdlib")
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import FTPServer
+
+class Server:
+    """
+    FTP server running on a background thread.
+    """
+    def __init__(self, home, port=0):
+        authorizer = DummyAuthorizer()
+        authorizer.add_user("user", "password", str(home), perm="elr")
+        handler = type("Handler", (FTPHandler,), {"authorizer": authorizer})
+        self.server = FTPServer(("127.0.0.1", port), handler)
+        self.port = self.server.address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"timeout": 0.05})
+        self.thread.start()
+
+    def stop(self):
+        self.server.close_all()
+        self.thread.join()
+
+@pytest.fixture
+def home(tmp_path):
+    home = tmp_path / "home"
+    home.mkdir()
+    (home / "data.bin").write_bytes(os.urandom(10000))
+    return home
+
+def retrieve(dest):
+    def function(ftp):
+        with open(dest, "wb") as f:
+            ftp.retrbinary("RETR data.bin", f.write)
+    return function
+
+def test_sessions_are_reused(home, tmp_path):
+    server = Server(home)
+    pool = FtpPool("127.0.0.1", "user", "password", port=server.port)
+    try:
+        for i in range(3):
+            assert pool.run(lambda ftp: ftp.nlst()) == ["data.bin"]
+        pool.run(retrieve(str(tmp_path / "data.bin")))
+        assert ((tmp_path / "data.bin").read_bytes() ==
+                (home / "data.bin").read_bytes())
+        assert pool.connects == 1
+        assert pool.reuses == 3
+    finally:
+        pool.close()
+        server.stop()
+
+def test_reconnect_after_server_restart(home):
+    server = Server(home)
+    port = server.port
+    # Idle sessions aren't checked, so the broken session is used.
+    pool = FtpPool("127.0.0.1", "user", "password", port=port,
+                   check_interval=3600)
+    try:
+        assert pool.run(lambda ftp: ftp.nlst()) == ["data.bin"]
+        server.stop()
+        server = Server(home, port=port)
+        assert pool.run(lambda ftp: ftp.nlst()) == ["data.bin"]
+        assert pool.connects == 2
+    finally:
+        pool.close()
+        server.stop()
+
+def test_local_errors_are_not_retried(home, tmp_path):
+    server = Server(home)
+    pool = FtpPool("127.0.0.1", "user", "password", port=server.port)
+    calls = []
+    def function(ftp):
+        calls.append(ftp)
+        retrieve(str(tmp_path / "missing" / "data.bin"))(ftp)
+    try:
+        with pytest.raises(FileNotFoundError):
+            pool.run(function)
+        assert len(calls) == 1
+        assert pool.connects == 1
+    finally:
+        pool.close()
+        server.stop()
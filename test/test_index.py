@@ -0,0 +1,261 @@
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+
+from wxdata.index import Index
+from conftest import granule_name
+
+PRODUCT = "CloudSat_2b_GeoProf"
+
+def add_unreadable_files(path):
+    """
+    Add a partial download and a corrupt granule to a folder.
+    """
+    t = datetime(2010, 1, 1, 1, 40)
+    with open(os.path.join(path, granule_name(t) + ".part"), "wb") as f:
+        f.write(b"partial")
+    with open(os.path.join(path, granule_name(t)), "wb") as f:
+        f.write(b"corrupt")
+
+def test_generate(granules):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    files = index.get_files(PRODUCT)
+    assert [f.filename for f in files] == filenames
+    assert files[0].start_time == datetime(2010, 1, 1, 0, 0, 30)
+    assert files[0].end_time == datetime(2010, 1, 1, 0, 19, 30)
+
+def test_generate_parallel(granules):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=2, chunk_size=1)
+    files = index.get_files(PRODUCT)
+    assert [f.filename for f in files] == filenames
+    assert all([not f.footprint is None for f in files])
+
+def test_fast_mode_skips_partial_downloads(granules):
+    path, filenames = granules
+    add_unreadable_files(str(path))
+    index = Index()
+    index.generate(str(path), workers=1, fast=True)
+    names = [f.filename for f in index.get_files(PRODUCT)]
+    assert not any([n.endswith(".part") for n in names])
+    assert len(names) == 4
+
+def test_fast_mode_drops_unreadable_files(granules):
+    path, filenames = granules
+    add_unreadable_files(str(path))
+    index = Index()
+    index.generate(str(path), workers=1, fast=True)
+
+    # The corrupt file starts before the start of the range, so it must
+    # be opened to determine its end time.
+    files = index.get_files(PRODUCT, start=datetime(2010, 1, 1, 1, 50))
+    assert files == []
+    assert [f.filename for f in index.get_files(PRODUCT)] == filenames
+
+def test_resolve_drops_unreadable_files(granules):
+    path, filenames = granules
+    add_unreadable_files(str(path))
+    index = Index()
+    index.generate(str(path), workers=1, fast=True)
+    index.resolve(workers=1)
+    files = index.get_files(PRODUCT)
+    assert [f.filename for f in files] == filenames
+    assert all([f.end_time_resolved for f in files])
+
+def test_lazy_resolution_updates_time_index(granules):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1, fast=True)
+    # Resolves the first file, whose start time moves by 30 seconds.
+    index.get_files(PRODUCT, start=datetime(2010, 1, 1, 0, 10))
+    files = index.get_files(PRODUCT, end=datetime(2010, 1, 1, 0, 0, 10))
+    assert files == []
+
+def test_store_keeps_resolved_times(granules, tmp_path):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1, fast=True)
+    index.get_files(PRODUCT, start=datetime(2010, 1, 1, 0, 10))
+    index.store(str(tmp_path / "index.db"))
+
+    loaded = Index.load(str(tmp_path / "index.db"))
+    files = loaded.get_files(PRODUCT)
+    assert files[0].end_time_resolved
+    assert not files[1].end_time_resolved
+
+    # Resolved records are kept by a loaded index.
+    start = datetime(2010, 1, 1, 0, 40)
+    loaded = Index.load(str(tmp_path / "index.db"))
+    files = loaded.get_files(PRODUCT, start=start)
+    assert [f.filename for f in files] == filenames[1:]
+    os.remove(filenames[1])
+    assert loaded.get_files(PRODUCT, start=start) == files
+
+def test_store_and_load(granules, tmp_path):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    index.store(str(tmp_path / "index.db"))
+
+    loaded = Index.load(str(tmp_path / "index.db"))
+    assert loaded.products == [PRODUCT]
+    start = datetime(2010, 1, 1, 0, 40)
+    end = datetime(2010, 1, 1, 1, 10)
+    queried = loaded.get_files(PRODUCT, start=start, end=end)
+    assert [f.filename for f in queried] == filenames[1:]
+
+    original = index.get_files(PRODUCT)
+    files = loaded.get_files(PRODUCT)
+    for f, g in zip(original, files):
+        assert f.filename == g.filename
+        assert f.start_time == g.start_time
+        assert f.end_time == g.end_time
+        assert f.fingerprint == g.fingerprint
+        assert (f.footprint == g.footprint).all()
+
+def test_convert_pickle(granules, tmp_path):
+    import pickle
+    from wxdata.index.storage import convert, is_sqlite
+
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    for f in index.get_files(PRODUCT):
+        f.make_relative(str(tmp_path))
+    index._storage = None
+    with open(str(tmp_path / "index.pckl"), "wb") as f:
+        pickle.dump(index, f)
+
+    convert(str(tmp_path / "index.pckl"), str(tmp_path / "index.pckl"))
+    assert is_sqlite(str(tmp_path / "index.pckl"))
+    loaded = Index.load(str(tmp_path / "index.pckl"))
+    assert [f.filename for f in loaded.get_files(PRODUCT)] == filenames
+
+def test_update(granules):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    os.remove(filenames[0])
+    shutil.copy(filenames[1], filenames[1] + ".copy.hdf")
+    index.update(str(path), workers=1)
+    names = [f.filename for f in index.get_files(PRODUCT)]
+    assert sorted(names) == sorted(filenames[1:] + [filenames[1] + ".copy.hdf"])
+
+def test_spatial_queries(granules):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    files = index.get_files(PRODUCT, region=(5.0, -5.0, 6.0, 6.0))
+    assert [f.filename for f in files] == filenames
+    assert index.get_files(PRODUCT, region=(100.0, 40.0, 110.0, 50.0)) == []
+
+def test_stream(granules):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    start = datetime(2010, 1, 1, 0, 10, 30)
+    chunks = list(index.stream(PRODUCT, start, None,
+                               ["radar_reflectivity", "latitude"],
+                               chunk_profiles=7))
+    lengths = [len(c["latitude"]) for c in chunks]
+    assert lengths == [7] * 7 + [1]
+    assert all([len(c["radar_reflectivity"]) == len(c["latitude"])
+                for c in chunks])
+
+def test_match(granules, tmp_path):
+    from conftest import write_granule
+
+    path, filenames = granules
+    # CPR granules starting 10 minutes after each GEOPROF granule.
+    cpr = []
+    for i in range(2):
+        t = datetime(2010, 1, 1, 0, 10) + i * timedelta(minutes=30)
+        filename = str(path / granule_name(t, product="1B-CPR"))
+        cpr += [write_granule(filename, t)]
+    index = Index()
+    index.generate(str(path), workers=1)
+    matches = list(index.match([PRODUCT, "CloudSat_1b_CPR"]))
+    assert [(a.filename, b.filename) for a, b in matches] == [
+        (filenames[0], cpr[0]), (filenames[1], cpr[1])
+    ]
+    assert index.write_matches(str(tmp_path / "matches.txt"),
+                               [PRODUCT, "CloudSat_1b_CPR"]) == 2
+
+@pytest.fixture
+def zipped_granules(granules, monkeypatch):
+    """
+    The granules as zip archives, which are extracted to disk.
+    """
+    import zipfile
+    import wxdata.readers
+
+    monkeypatch.setattr(wxdata.readers, "max_memory_bytes", 0)
+    path, filenames = granules
+    for filename in filenames:
+        with zipfile.ZipFile(filename + ".zip", "w") as f:
+            f.write(filename, os.path.basename(filename))
+        os.remove(filename)
+    index = Index()
+    index.generate(str(path), workers=1)
+    return index.get_files(PRODUCT)
+
+def record_calls(monkeypatch, name):
+    """
+    Record the arguments of calls to a function used by wxdata.index.
+    """
+    import wxdata.index
+
+    calls = []
+    function = getattr(wxdata.index, name)
+    def wrapper(filename, *args):
+        calls.append(filename)
+        return function(filename, *args)
+    monkeypatch.setattr(wxdata.index, name, wrapper)
+    return calls
+
+def test_prefetch_order_and_depth(zipped_granules, monkeypatch):
+    from wxdata.index import prefetch
+
+    records = zipped_granules
+    assert len(records) == 3
+    sizes = record_calls(monkeypatch, "decompressed_size")
+    times = []
+    for product in prefetch(records, depth=1):
+        if not times:
+            # The current file and one file ahead.
+            assert len(sizes) == 2
+        times.append(product.start_time)
+    assert times == [r.start_time for r in records]
+
+def test_prefetch_max_bytes(zipped_granules, monkeypatch):
+    from wxdata.index import prefetch
+    from wxdata.readers import decompressed_size
+
+    records = zipped_granules
+    size = decompressed_size(records[0].filename)
+    calls = record_calls(monkeypatch, "decompress")
+    for i, product in enumerate(prefetch(records, depth=2, max_bytes=size)):
+        # Only the current file fits into the budget.
+        assert len(calls) == i + 1
+
+    # A single file exceeding the budget is still delivered.
+    products = prefetch(records, max_bytes=size // 2)
+    times = [p.start_time for p in products]
+    assert times == [r.start_time for r in records]
+
+def test_prefetch_cleans_up_after_break(zipped_granules):
+    from wxdata.index import prefetch
+    from wxdata.readers import _folder
+
+    before = set(os.listdir(_folder.name))
+    products = prefetch(zipped_granules, depth=2)
+    for product in products:
+        assert set(os.listdir(_folder.name)) != before
+        break
+    products.close()
+    assert set(os.listdir(_folder.name)) == before
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from wxdata.index import Index
+from wxdata.index.overpasses import (chord_length, great_circle_distance,
+                                     to_unit_vectors)
+
+pytest.importorskip("scipy")
+
+PRODUCT = "CloudSat_2b_GeoProf"
+
+def test_chord_length_round_trip():
+    distances = np.array([0.0, 1.0, 100.0, 5000.0])
+    assert np.allclose(great_circle_distance(chord_length(distances)),
+                       distances)
+    vectors = to_unit_vectors([0.0, 1.0], [0.0, 0.0])
+    chord = np.linalg.norm(vectors[0] - vectors[1])
+    assert np.isclose(great_circle_distance(chord), 111.19, atol=0.01)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_find_overpasses(granules, workers):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    # Profile 10 of every granule lies at the first station.
+    stations = [(200.0 / 19.0, -10.0 + 200.0 / 19.0), (100.0, 50.0)]
+    overpasses, failed = index.find_overpasses(PRODUCT, stations, 50.0,
+                                               workers=workers, chunk_size=1)
+    assert failed == []
+    assert [f for f, _, _ in overpasses[0]] == filenames
+    for _, profiles, distance in overpasses[0]:
+        assert profiles.tolist() == [10]
+        assert distance < 1.0
+    assert overpasses[1] == []
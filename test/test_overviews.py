@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+from wxdata.index import Index
+from wxdata.index.overviews import compute_overviews, overview_path
+
+PRODUCT = "CloudSat_2b_GeoProf"
+
+def test_compute_overviews():
+    data = np.ma.masked_array(np.arange(32, dtype=np.float32).reshape(8, 4))
+    data[0, 0] = np.ma.masked
+    overviews = compute_overviews(data, levels=2)
+    assert overviews[0]["block"] == (4, 2)
+    assert overviews[1]["block"] == (8, 4)
+    assert overviews[0]["mean"].shape == (2, 2)
+    assert np.isclose(overviews[0]["mean"][0, 0],
+                      np.mean([1, 4, 5, 8, 9, 12, 13]))
+    assert overviews[0]["valid_fraction"][0, 0] == np.float32(7 / 8)
+    assert overviews[1]["max"][0, 0] == 31
+
+def test_overview_paths_depend_on_folder():
+    a = overview_path("overviews", PRODUCT, "field", "/a/granule.hdf")
+    b = overview_path("overviews", PRODUCT, "field", "/b/granule.hdf")
+    assert a != b
+
+def test_read_overviews(granules, tmp_path):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    directory = str(tmp_path / "overviews")
+    failed = index.generate_overviews(PRODUCT, "radar_reflectivity",
+                                      directory, levels=2, workers=1)
+    assert failed == []
+
+    overviews = index.read_overviews(PRODUCT, "radar_reflectivity", directory)
+    assert [r.filename for r, _ in overviews] == filenames
+    assert all([o["block"] == (16, 4) for _, o in overviews])
+
+    overviews = index.read_overviews(PRODUCT, "radar_reflectivity", directory,
+                                     resolution=(4, 2))
+    assert all([o["block"] == (4, 2) for _, o in overviews])
+
+    overviews = index.read_overviews(PRODUCT, "radar_reflectivity", directory,
+                                     resolution=(1, 1))
+    assert all([o["block"] == (1, 1) for _, o in overviews])
+    assert overviews[0][1]["mean"].shape == (20, 8)
+
+def test_outdated_overviews_are_not_read(granules, tmp_path):
+    from conftest import write_granule
+
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    directory = str(tmp_path / "overviews")
+    index.generate_overviews(PRODUCT, "radar_reflectivity", directory,
+                             levels=2, workers=1)
+
+    # Replace the first granule with one of a different size.
+    os.remove(filenames[0])
+    write_granule(filenames[0], index.get_files(PRODUCT)[0].start_time,
+                  n_profiles=30)
+    overviews = index.read_overviews(PRODUCT, "radar_reflectivity", directory)
+    assert overviews[0][1]["block"] == (1, 1)
+    assert overviews[0][1]["mean"].shape == (30, 8)
+    assert all([o["block"] == (16, 4) for _, o in overviews[1:]])
@@ -0,0 +1,116 @@
+import bz2
+import gzip
+import lzma
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from wxdata.readers import decompress, decompressed_size
+from wxdata.readers.cache import ExtractionCache
+from wxdata.readers.formats import (Decompressor, GzipDecompressor,
+                                    get_decompressor)
+
+DATA = b"".join([bytes([i % 251]) for i in range(100000)])
+
+def write_archive(path, suffix, data=DATA, name="granule.hdf"):
+    """
+    Write data as member name of an archive with the given suffix.
+    """
+    filename = os.path.join(str(path), name + suffix)
+    if suffix == ".zip":
+        with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as f:
+            f.writestr(name, data)
+    elif suffix == ".gz":
+        with gzip.open(filename, "wb") as f:
+            f.write(data)
+    elif suffix == ".bz2":
+        with bz2.open(filename, "wb") as f:
+            f.write(data)
+    elif suffix == ".xz":
+        with lzma.open(filename, "wb") as f:
+            f.write(data)
+    else:
+        member = os.path.join(str(path), name)
+        with open(member, "wb") as f:
+            f.write(data)
+        with tarfile.open(filename, "w" if suffix == ".tar" else
+                          "w:" + suffix.split(".")[-1]) as f:
+            f.add(member, arcname=name)
+        os.remove(member)
+    return filename
+
+SUFFIXES = [".zip", ".gz", ".bz2", ".xz", ".tar", ".tar.gz", ".tar.bz2"]
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+@pytest.mark.parametrize("memory_limit", [0, 2 ** 20])
+def test_decompress(tmp_path, suffix, memory_limit):
+    filename = write_archive(tmp_path, suffix)
+    assert decompressed_size(filename) >= 0
+    decompressed, artifact = decompress(filename, memory_limit=memory_limit)
+    assert os.path.basename(decompressed) == "granule.hdf"
+    with open(decompressed, "rb") as f:
+        assert f.read() == DATA
+    artifact.close()
+    assert not os.path.exists(decompressed)
+
+@pytest.mark.parametrize("suffix", [".zip", ".gz", ".tar.gz"])
+def test_decompressed_size(tmp_path, suffix):
+    filename = write_archive(tmp_path, suffix)
+    assert decompressed_size(filename) == len(DATA)
+
+def test_uncompressed_files_are_not_decompressed(tmp_path):
+    filename = str(tmp_path / "granule.hdf")
+    with open(filename, "wb") as f:
+        f.write(DATA)
+    assert decompress(filename) == (filename, None)
+    assert decompressed_size(filename) == 0
+
+def test_gzip_size_is_unknown_if_it_may_wrap(tmp_path):
+    # Random data doesn't compress, so the compressed file is large enough
+    # for the uncompressed size to possibly exceed 2 ** 32 bytes.
+    filename = write_archive(tmp_path, ".gz", data=os.urandom(5 * 2 ** 20))
+    assert GzipDecompressor().size(filename, "granule.hdf") is None
+    filename = write_archive(tmp_path, ".gz", data=DATA, name="small")
+    assert GzipDecompressor().size(filename, "small") == len(DATA)
+
+def test_most_specific_suffix_wins():
+    assert type(get_decompressor("a.tar.gz")).__name__ == "TarDecompressor"
+    assert type(get_decompressor("a.gz")).__name__ == "GzipDecompressor"
+    assert get_decompressor("a.hdf") is None
+
+def test_decompressor_is_abstract():
+    with pytest.raises(TypeError):
+        Decompressor()
+
+def test_extraction_cache(tmp_path):
+    filename = write_archive(tmp_path, ".zip")
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    first = cache.get(filename)
+    second = cache.get(filename)
+    assert first.filename == second.filename
+    with open(first.filename, "rb") as f:
+        assert f.read() == DATA
+    first.close()
+    second.close()
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+    assert cache.stats["pinned"] == 0
+
+    # Entries persist across cache objects.
+    other = ExtractionCache(str(tmp_path / "cache"))
+    other.get(filename).close()
+    assert other.stats["hits"] == 1
+
+def test_extraction_cache_eviction(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=len(DATA))
+    first = cache.get(write_archive(tmp_path, ".zip", name="a.hdf"))
+    # Pinned entries are not evicted.
+    second = cache.get(write_archive(tmp_path, ".zip", name="b.hdf"))
+    assert os.path.exists(first.filename)
+    first.close()
+    second.close()
+    cache.get(write_archive(tmp_path, ".zip", name="c.hdf")).close()
+    assert not os.path.exists(first.filename)
+    assert cache.stats["evictions"] >= 1
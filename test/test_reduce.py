@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from wxdata.index import Index
+from wxdata.index.accumulators import Accumulator, Count, Histogram, Moments
+from wxdata.products import CloudSat_2b_GeoProf
+
+PRODUCT = "CloudSat_2b_GeoProf"
+
+def read_all(filenames):
+    data = []
+    for f in filenames:
+        file = CloudSat_2b_GeoProf(f)
+        data += [file.radar_reflectivity]
+        file.close()
+    return np.ma.concatenate(data)
+
+def test_accumulator_is_abstract():
+    with pytest.raises(TypeError):
+        Accumulator()
+
+def test_merge_into_empty_accumulator():
+    data = {"x": np.ma.masked_invalid([1.0, 2.0, np.nan, 4.0])}
+    moments = Moments("x")
+    moments.update(data)
+    result = moments.empty().merge(moments)
+    assert result.count[0] == 3
+    assert np.isclose(result.mean[0], 7 / 3)
+    assert np.isclose(result.variance[0], np.var([1.0, 2.0, 4.0], ddof=1))
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_reduce(granules, workers):
+    path, filenames = granules
+    index = Index()
+    index.generate(str(path), workers=1)
+    expected = read_all(filenames)
+    valid = expected.compressed()
+
+    count, failed = index.reduce(PRODUCT, None, None, None,
+                                 Count("radar_reflectivity"),
+                                 workers=workers, chunk_size=1)
+    assert failed == []
+    assert count.profiles == expected.shape[0]
+    assert count.count == valid.size
+
+    bins = np.linspace(-40, 50, 10)
+    histogram, _ = index.reduce(PRODUCT, None, None, None,
+                                Histogram("radar_reflectivity", bins),
+                                workers=workers, chunk_size=1)
+    assert (histogram.counts == np.histogram(valid, bins=bins)[0]).all()
+
+    moments, _ = index.reduce(PRODUCT, None, None, None,
+                              Moments("radar_reflectivity"),
+                              workers=workers, chunk_size=1)
+    assert np.isclose(moments.mean[0], valid.mean())
+    assert np.isclose(moments.variance[0], valid.var(ddof=1))
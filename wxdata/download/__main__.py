@@ -5,7 +5,61 @@ import os
 import tqdm
 import wxdata.products
 import wxdata.download.domains
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from wxdata.download.scheduler import DownloadScheduler
+
+def _positive_int(value):
+    """
+    Parse command line argument that must be a positive integer.
+    """
+    try:
+        n = int(value)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError(
+            "'{}' is not a positive integer.".format(value)
+        )
+    return n
+
+def queue_files(scheduler, provider, days, output_dir, workers=4):
+    """
+    Queue the files of the given days for download.
+
+    The listing of a day may include files that start on the following
+    day. Each file is stored in the folder of the day it starts on.
+
+    Arguments:
+        scheduler(:class:`DownloadScheduler`): The scheduler to queue the
+            files with.
+        provider: The data provider to download the files from.
+        days(:code:`list`): The days for which to download the files.
+        output_dir(:code:`str`): The folder below which to store the files.
+        workers(:code:`int`): The number of days to list concurrently.
+    """
+    def list_files(t0):
+        try:
+            return provider.get_files_in_range(t0, t0 + timedelta(days=1))
+        except:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        listings = pool.map(list_files, days)
+        for t0, files in zip(days, tqdm.tqdm(listings,
+                                             total=len(days),
+                                             unit=" days")):
+            if files is None:
+                tqdm.tqdm.write(f"No files found for {t0:%Y-%m-%d}.")
+                continue
+            for f in files:
+                t = provider.product.name_to_date(f)
+                dest = os.path.join(output_dir,
+                                    "{:04d}".format(t.year),
+                                    "{:02d}".format(t.month),
+                                    "{:02d}".format(t.day),
+                                    f)
+                scheduler.add(provider, f, dest)
 
 def main():
     ###########################################################################
@@ -37,6 +91,12 @@ def main():
                         nargs=1,
                         metavar=("<output_folder>",),
                         help="The output directory in which to store the data.")
+    parser.add_argument("--concurrency",
+                        type=_positive_int,
+                        default=4,
+                        metavar="<n>",
+                        help="The maximum number of concurrent downloads from"
+                        " the provider.")
 
     args = parser.parse_args()
 
@@ -55,10 +115,11 @@ def main():
         return 1
 
     provider = provider(product)
+    provider.max_connections = args.concurrency
 
-    years = map(int, args.years)
+    years = list(map(int, args.years))
     if not args.months is None:
-        months = map(int, args.months)
+        months = list(map(int, args.months))
     else:
         months = list(range(1, 13))
 
@@ -70,27 +131,21 @@ def main():
     # Download files
     ###########################################################################
 
-    for y in years:
-        for m in months:
-            for d in range(calendar.monthlen(y, m)):
-                print(f"Processing {y}-{m}-{d}")
-                dest = os.path.join(output_dir,
-                                    "{:04d}".format(y),
-                                    "{:02d}".format(m),
-                                    "{:02d}".format(d + 1))
-                if not os.path.exists(dest):
-                    os.makedirs(dest)
-                t0 = datetime(y, m, d + 1)
-                t1 = t0 + timedelta(days=1)
-                try:
-                    files = provider.get_files_in_range(t0, t1)
-                except:
-                    print("No files found.")
-                    continue
-                for f in tqdm.tqdm(files):
-                    provider.download(f, os.path.join(dest, f))
+    days = [datetime(y, m, d + 1)
+            for y in years
+            for m in months
+            for d in range(calendar.monthrange(y, m)[1])]
 
+    scheduler = DownloadScheduler(max_concurrent=args.concurrency)
+    scheduler.add_provider(provider, args.concurrency)
+    queue_files(scheduler, provider, days, output_dir, args.concurrency)
 
+    failed = scheduler.run()
+    for f, error in failed:
+        print(f"Failed to download {f}: {error}")
+
+    if failed:
+        return 1
     return 0
 
 if __name__ == '__main__':
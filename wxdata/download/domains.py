@@ -5,11 +5,12 @@ import shutil
 import tempfile
 from abc import ABCMeta, abstractmethod
 from datetime import datetime, timedelta
-from ftplib   import FTP
+import ftplib
 import os
 import numpy as np
 
 from wxdata.download.configuration import get_identity
+from wxdata.download.ftp import get_pool
 
 class DataProvider(metaclass = ABCMeta):
     """
@@ -207,8 +208,13 @@ icare_products = {
 class IcareProvider(DataProvider):
     """
     Base class for data products available from the ICARE ftp server.
+
+    All providers share a pool of logged-in sessions to the server, which
+    is limited to :code:`max_connections` sessions.
     """
     base_url = "ftp.icare.univ-lille1.fr"
+    port = 21
+    max_connections = 4
 
     def __init__(self, product):
         """
@@ -230,6 +236,17 @@ class IcareProvider(DataProvider):
         self.product_path = os.path.join(*icare_products[product.__name__])
         self.cache = {}
 
+    def _pool(self):
+        """
+        The session pool for the ICARE server.
+        """
+        identity = get_identity("Icare")
+        return get_pool(self.base_url,
+                        identity["user"],
+                        identity["password"],
+                        self.max_connections,
+                        port=self.port)
+
     def __ftp_listing_to_list__(self, path, t = int):
         """
         Retrieve directory content from ftp listing as list.
@@ -247,20 +264,15 @@ class IcareProvider(DataProvider):
 
         """
         if not path in self.cache:
-            #try:
-            with FTP(IcareProvider.base_url) as ftp:
-                identity = get_identity("Icare")
-                ftp.login(user = identity["user"],
-                        passwd = identity["password"])
-                try:
-                    ftp.cwd(path)
-                except:
-                    raise Exception("Can't find product folder " + path  +
-                                    "on the ICARE ftp server.. Are you sure this is"
-                                    "a  ICARE multi sensor product?")
-                ls = ftp.nlst()
-            #except:
-            #    ls = []
+            def listing(ftp):
+                ftp.cwd(os.path.join(ftp.home, path))
+                return ftp.nlst()
+            try:
+                ls = self._pool().run(listing)
+            except ftplib.error_perm:
+                raise Exception("Can't find product folder " + path  +
+                                "on the ICARE ftp server.. Are you sure this is"
+                                "a  ICARE multi sensor product?")
             ls = [t(l) for l in ls]
             self.cache[path] = ls
         return self.cache[path]
@@ -295,9 +307,12 @@ class IcareProvider(DataProvider):
         path = os.path.join(self.product_path, str(date.year),
                             date.strftime("%Y_%m_%d"))
 
-        identity = get_identity("Icare")
-        with FTP(self.base_url) as ftp:
-            ftp.login(user = identity['user'], passwd = identity['password'])
-            ftp.cwd(path)
-            with open(dest, 'wb') as f:
+        # The file is opened before the transfer, so that errors opening it
+        # aren't mistaken for connection errors.
+        with open(dest, 'wb') as f:
+            def retrieve(ftp):
+                f.seek(0)
+                f.truncate()
+                ftp.cwd(os.path.join(ftp.home, path))
                 ftp.retrbinary('RETR ' + filename, f.write)
+            self._pool().run(retrieve)
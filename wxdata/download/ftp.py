@@ -0,0 +1,222 @@
+"""
+Pool of authenticated FTP sessions.
+
+Opening an FTP connection and logging in takes several round trips,
+which dominate the time needed to list a directory or to download a
+small file. The :class:`FtpPool` keeps logged-in sessions open and hands
+them out to callers, so that consecutive requests to the same host reuse
+the same session.
+"""
+import ftplib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from ftplib import FTP
+
+# Errors indicating that a session is broken. Other errors, e.g. from
+# writing local files, are not retried. socket.timeout is only an alias of
+# TimeoutError from Python 3.10 on.
+_connection_errors = (ConnectionError, TimeoutError, socket.timeout,
+                      socket.gaierror, EOFError, ftplib.error_temp,
+                      ftplib.error_reply, ftplib.error_proto)
+
+class FtpPool:
+    """
+    Thread-safe pool of logged-in FTP sessions to a single host.
+
+    Sessions are checked with a :code:`NOOP` command before they are
+    handed out if they have been idle for longer than
+    :code:`check_interval`. Broken sessions are closed and replaced by new
+    ones.
+
+    Attributes:
+        host(:code:`str`): The FTP server.
+        max_connections(:code:`int`): The maximum number of sessions that
+            are open at the same time.
+        connects(:code:`int`): The number of sessions that were opened.
+        reuses(:code:`int`): The number of times an open session was
+            reused.
+    """
+    def __init__(self,
+                 host,
+                 user,
+                 password,
+                 max_connections=4,
+                 port=21,
+                 timeout=60,
+                 check_interval=10):
+        """
+        Arguments:
+            host(:code:`str`): The FTP server.
+            user(:code:`str`): The user name to log in with.
+            password(:code:`str`): The password to log in with.
+            max_connections(:code:`int`): The maximum number of sessions.
+            port(:code:`int`): The port of the FTP server.
+            timeout(:code:`float`): Timeout for blocking operations in
+                seconds.
+            check_interval(:code:`float`): Sessions that have been idle for
+                longer than this number of seconds are checked before they
+                are reused.
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.connects = 0
+        self.reuses = 0
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Open and log in new session.
+        """
+        ftp = FTP(timeout=self.timeout)
+        try:
+            ftp.connect(self.host, self.port)
+            ftp.login(user=self.user, passwd=self.password)
+            # Paths are resolved relative to the initial directory, so that
+            # changing directories doesn't affect later requests.
+            ftp.home = ftp.pwd()
+        except BaseException:
+            ftp.close()
+            raise
+        with self._lock:
+            self.connects += 1
+        return ftp
+
+    @staticmethod
+    def _close(ftp):
+        try:
+            ftp.quit()
+        except Exception:
+            ftp.close()
+
+    def _healthy(self, ftp, idle):
+        """
+        Check whether an idle session can be reused.
+        """
+        if ftp.sock is None:
+            return False
+        if idle < self.check_interval:
+            return True
+        try:
+            ftp.voidcmd("NOOP")
+            return True
+        except Exception:
+            return False
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    ftp, released = self._idle.pop()
+                if self._healthy(ftp, time.monotonic() - released):
+                    with self._lock:
+                        self.reuses += 1
+                    return ftp
+                self._close(ftp)
+            return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, ftp, broken=False):
+        if broken:
+            self._close(ftp)
+        else:
+            with self._lock:
+                self._idle.append((ftp, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager providing a logged-in session.
+
+        Blocks while :code:`max_connections` sessions are in use. Sessions
+        that raise an error other than :code:`ftplib.error_perm` are closed
+        instead of being returned to the pool.
+        """
+        ftp = self._acquire()
+        try:
+            yield ftp
+        except ftplib.error_perm:
+            # Permanent errors, such as missing files, leave the session
+            # usable.
+            self._release(ftp)
+            raise
+        except BaseException:
+            # The state of the session is unknown after errors, e.g. an
+            # interrupted transfer.
+            self._release(ftp, broken=True)
+            raise
+        else:
+            self._release(ftp)
+
+    def run(self, function, retries=2):
+        """
+        Run function with a session from the pool.
+
+        If the session fails with a connection error, the function is run
+        again with a new session. Other errors, such as errors from local
+        file operations, are raised immediately.
+
+        Arguments:
+            function: Function taking the session as only argument.
+            retries(:code:`int`): The number of times to retry after a
+                connection error.
+
+        Returns:
+            The return value of function.
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.session() as ftp:
+                    return function(ftp)
+            except _connection_errors:
+                if attempt == retries:
+                    raise
+
+    def close(self):
+        """
+        Close all idle sessions.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for ftp, _ in idle:
+            self._close(ftp)
+
+# Pools shared by all data providers.
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host, user, password, max_connections=4, port=21):
+    """
+    Get shared session pool for a host and user.
+
+    Arguments:
+        host(:code:`str`): The FTP server.
+        user(:code:`str`): The user name to log in with.
+        password(:code:`str`): The password to log in with.
+        max_connections(:code:`int`): The maximum number of sessions, used
+            when the pool is created.
+        port(:code:`int`): The port of the FTP server.
+
+    Returns:
+        The :class:`FtpPool` object for the given host and user.
+    """
+    with _pools_lock:
+        key = (host, port, user)
+        if not key in _pools:
+            _pools[key] = FtpPool(host, user, password, max_connections,
+                                  port=port)
+        return _pools[key]
@@ -0,0 +1,120 @@
+"""
+Concurrent downloads.
+
+The :class:`DownloadScheduler` collects the files to download from one
+or several data providers and downloads them on a thread pool. The number
+of concurrent downloads from each provider is limited separately, so
+that no server receives more connections than it accepts.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tqdm
+
+class DownloadScheduler:
+    """
+    Thread pool downloading files from data providers.
+
+    Attributes:
+        max_concurrent(:code:`int`): Default limit for the number of
+            concurrent downloads from a provider.
+        failed(:code:`list`): Tuples :code:`(filename, error)` of the files
+            that could not be downloaded.
+    """
+    def __init__(self, max_concurrent=4):
+        """
+        Arguments:
+            max_concurrent(:code:`int`): Default limit for the number of
+                concurrent downloads from a provider.
+        """
+        self.max_concurrent = max_concurrent
+        self.failed = []
+        self._tasks = []
+        self._seen = set()
+        self._limits = {}
+
+    def add_provider(self, provider, max_concurrent=None):
+        """
+        Set limit for the number of concurrent downloads from a provider.
+
+        Arguments:
+            provider: The data provider.
+            max_concurrent(:code:`int`): The maximum number of concurrent
+                downloads from this provider.
+        """
+        if max_concurrent is None:
+            max_concurrent = self.max_concurrent
+        self._limits[id(provider)] = (threading.Semaphore(max_concurrent),
+                                      max_concurrent)
+
+    def add(self, provider, filename, dest):
+        """
+        Queue file for download. Files that are already queued for the
+        same path are ignored.
+
+        Arguments:
+            provider: The data provider to download the file from.
+            filename(:code:`str`): The name of the file.
+            dest(:code:`str`): The path to store the file at.
+        """
+        key = (filename, os.path.abspath(dest))
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        if not id(provider) in self._limits:
+            self.add_provider(provider)
+        self._tasks.append((provider, filename, dest))
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def _download(self, provider, filename, dest):
+        with self._limits[id(provider)][0]:
+            directory = os.path.dirname(dest)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Download to a temporary name so that interrupted downloads
+            # don't leave incomplete files behind.
+            partial = dest + ".part"
+            provider.download(filename, partial)
+            os.replace(partial, dest)
+            return os.path.getsize(dest)
+
+    def run(self):
+        """
+        Download all queued files.
+
+        Progress is reported in a single progress bar showing the number
+        of downloaded files, the throughput and the estimated time until
+        all downloads have finished.
+
+        Returns:
+            List of tuples :code:`(filename, error)` describing the files
+            that could not be downloaded.
+        """
+        n_workers = sum([n for _, n in self._limits.values()])
+        tasks, self._tasks = self._tasks, []
+        downloaded = 0
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(n_workers, 1)) as pool, \
+             tqdm.tqdm(total=len(tasks), unit=" files") as progress:
+            futures = dict([(pool.submit(self._download, *task), task)
+                            for task in tasks])
+            for future in as_completed(futures):
+                _, filename, dest = futures[future]
+                try:
+                    downloaded += future.result()
+                except Exception as e:
+                    self.failed += [(filename,
+                                     "{}: {}".format(type(e).__name__, e))]
+                    if os.path.exists(dest + ".part"):
+                        os.remove(dest + ".part")
+                elapsed = max(time.monotonic() - start, 1e-6)
+                progress.set_postfix(
+                    throughput="{:.2f} MB/s".format(downloaded / elapsed / 1e6),
+                    failed=len(self.failed)
+                )
+                progress.update(1)
+        return self.failed
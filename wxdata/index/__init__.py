@@ -1,18 +1,84 @@
 import os
-import glob
-import pickle
-from copy import deepcopy
-from datetime import datetime
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from heapq import merge
+from itertools import accumulate, islice, product as combinations
 from tqdm import tqdm
+import numpy as np
 
 import wxdata
 from wxdata.products import all_products
-from wxdata.readers import decompress
+from wxdata.readers import decompress, decompressed_size, get_decompressor
+from wxdata.readers.cache import file_fingerprint
+from wxdata.index.storage import SqliteStorage, is_sqlite, load_pickle
+from wxdata.index.spatial import BoxTree, product_footprint, to_region
+from wxdata.index.cache import handles
+from wxdata.index.transcode import transcode_cache
+from wxdata.index.overpasses import _find_overpasses, to_unit_vectors
+from wxdata.index.overviews import (_generate_overviews, full_resolution,
+                                    overview_path, read_fingerprint,
+                                    read_overview)
 
 ################################################################################
 # FileRecord
 ################################################################################
 
+def _is_product_file(name, products):
+    """
+    Whether a filename belongs to a product file.
+
+    Arguments:
+        name(:code:`str`): The filename without folder.
+        products(:code:`list`): Tuples :code:`(pattern, suffixes)` of
+            the known products.
+    """
+    archive = not get_decompressor(name) is None
+    for pattern, suffixes in products:
+        if pattern.match(name):
+            return archive or name.lower().endswith(suffixes)
+    return False
+
+def _walk(path):
+    """
+    Recursively find product files in folder tree.
+
+    Folders are traversed lazily, so that files can be processed as soon
+    as they are found. Hidden files and folders are skipped, and only
+    files whose names match the pattern of a known product and end in
+    the suffix of the product or of a known archive format are returned.
+    This excludes, for example, partial downloads.
+
+    Arguments:
+        path(:code:`str`): Root folder of the folder-tree to traverse.
+
+    Returns:
+        Generator of tuples :code:`(filename, fingerprint)`.
+    """
+    products = [(c.pattern, tuple(c.suffixes)) for c in all_products]
+    folders = [path]
+    while folders:
+        try:
+            entries = os.scandir(folders.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir():
+                        folders.append(entry.path)
+                        continue
+                    if not _is_product_file(entry.name, products):
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, (stat.st_size, stat.st_mtime_ns)
+
 class FileRecord:
     """
     A FileRecord hold a reference to an indexed data file. It holds
@@ -25,9 +91,21 @@ class FileRecord:
         start_time(:code:`datetime`): Timestamp of the first data entry
             in this file.
         end_time(:code:`datetime`): Timestamp of the last data entry
-            in this file.
+            in this file. For records created from the filename only,
+            the file is opened to determine the end time when it is
+            first accessed.
+        end_time_resolved(:code:`bool`): Whether the end time has been
+            determined from the file.
+        max_end_time(:code:`datetime`): The end time if it has been
+            resolved, otherwise an upper bound for it.
+        fingerprint(:code:`tuple`): Size and modification time of the
+            file at the time it was indexed.
+        footprint(:code:`numpy.ndarray`): Bounding boxes of the segments
+            of the ground track of the file as computed by
+            :func:`wxdata.index.spatial.footprint`. None if the file
+            hasn't been opened or has no geolocation.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, fast=False, fingerprint=None):
         """
         Create a file record from a given file name.
 
@@ -37,18 +115,93 @@ class FileRecord:
 
         Arguments:
             filename(:code:`str`): The filename of the file to index.
+            fast(:code:`bool`): If true and the product encodes the start
+                time in the filename, the start time is taken from the
+                filename and the file is not opened.
+            fingerprint(:code:`tuple`): Size and modification time of the
+                file, if already known.
         """
         self.filename = filename
+        if fingerprint is None:
+            fingerprint = file_fingerprint(filename)
+        self.fingerprint = fingerprint
+        self.footprint = None
+        self._end_time = None
         for c in all_products:
             name = os.path.basename(filename)
             if c.pattern.match(name):
                 self.product = c.__name__
-                file = self.open()
-                self.start_time = file.start_time
-                self.end_time = file.end_time
+                if fast and hasattr(c, "granule_duration"):
+                    self.start_time = c.name_to_date(filename)
+                    return None
+                self.resolve()
                 return None
         self.product = None
 
+    def __setstate__(self, state):
+        # Records pickled by earlier versions store the end time directly.
+        if "end_time" in state:
+            state["_end_time"] = state.pop("end_time")
+        state.setdefault("footprint", None)
+        self.__dict__.update(state)
+
+    @property
+    def end_time(self):
+        if self._end_time is None and not self.product is None:
+            self.resolve()
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, end_time):
+        self._end_time = end_time
+
+    @property
+    def end_time_resolved(self):
+        return not self._end_time is None
+
+    @property
+    def max_end_time(self):
+        if self._end_time is None and not self.product is None:
+            product_class = getattr(wxdata.products, self.product)
+            return self.start_time + product_class.granule_duration
+        return self._end_time
+
+    def resolve(self):
+        """
+        Open file and determine start time, end time and footprint. For
+        records created from the filename only, this replaces the start
+        time taken from the filename, which is truncated to seconds.
+        """
+        file = self.open(cached=False)
+        self.start_time = file.start_time
+        self._end_time = file.end_time
+        self.footprint = product_footprint(file)
+        file.close()
+
+    @staticmethod
+    def from_attributes(filename, product, start_time, end_time,
+                        fingerprint=None, footprint=None):
+        """
+        Create a file record from known attributes without opening the file.
+
+        Arguments:
+            filename(:code:`str`): The filename of the indexed file.
+            product(:code:`str`): The name of the product class of the file.
+            start_time(:code:`datetime`): Timestamp of the first data entry.
+            end_time(:code:`datetime`): Timestamp of the last data entry.
+            fingerprint(:code:`tuple`): Size and modification time of the
+                file when it was indexed.
+            footprint(:code:`numpy.ndarray`): The footprint of the file.
+        """
+        record = FileRecord.__new__(FileRecord)
+        record.filename = filename
+        record.product = product
+        record.start_time = start_time
+        record._end_time = end_time
+        record.fingerprint = fingerprint
+        record.footprint = footprint
+        return record
+
     def make_relative(self, path):
         """
         Converts filename attribute into a relative path.
@@ -70,14 +223,44 @@ class FileRecord:
         """
         self.filename = os.path.join(path, self.filename)
 
-    def open(self):
+    def open(self, cached=False):
         """
         Open data product corresponding to this record.
+
+        Arguments:
+            cached(:code:`bool`): If true, the file is looked up in
+                :data:`wxdata.index.cache.handles` and kept open after
+                use. Files obtained from the cache are shared between
+                callers, must not be closed by them and become unusable
+                when they are evicted from the cache. If
+                :data:`wxdata.index.transcode.transcode_cache` is enabled,
+                the fields of the file are instead served from the
+                transcoded copy of the file.
         """
         if self.product is None:
             raise Exception("Cannot open file: Product is unknown.")
 
-        filename, artifact = decompress(self.filename)
+        if cached and transcode_cache.enabled:
+            return transcode_cache.get(self.filename,
+                                       self.product,
+                                       lambda: self.open(cached=False))
+        if cached:
+            key = (self.product, os.path.abspath(self.filename))
+            return handles.get(key, lambda: self.open(cached=False))
+
+        return self._open(*decompress(self.filename))
+
+    def _open(self, filename, artifact):
+        """
+        Open product from decompressed file.
+
+        Arguments:
+            filename(:code:`str`): The decompressed file.
+            artifact: The artifact returned by
+                :func:`wxdata.readers.decompress`.
+        """
+        if self.product is None:
+            raise Exception("Cannot open file: Product is unknown.")
         product_class = getattr(wxdata.products, self.product)
         product = product_class(filename)
         product.artifact = artifact
@@ -90,13 +273,278 @@ class FileRecord:
         return self.product + " file: " + self.filename
 
 ################################################################################
-# FileRecord
+# Parallel processing
+################################################################################
+
+def _chunks(iterable, size):
+    """
+    Split iterable into lists of at most the given size.
+
+    Arguments:
+        iterable: The iterable to split up.
+        size(:code:`int`): The maximum number of elements per chunk.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _parallel_map(function, iterable, workers):
+    """
+    Order-preserving, lazy map over a process pool.
+
+    At most two tasks per worker are kept in flight so that the iterable
+    can be consumed as it is produced.
+
+    Arguments:
+        function: Picklable function to apply to the elements of iterable.
+        iterable: The elements to apply the function to.
+        workers(:code:`int`): The number of worker processes. If smaller
+            than two, function is applied serially in the calling process.
+    """
+    if workers is None or workers < 2:
+        yield from map(function, iterable)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for element in iterable:
+            pending.append(pool.submit(function, element))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _create_records(files, fast=False):
+    """
+    Create file records for a list of files.
+
+    Arguments:
+        files(:code:`list`): Tuples :code:`(filename, fingerprint)` of
+            the files to index.
+        fast(:code:`bool`): Whether to determine times from filenames
+            only.
+
+    Returns:
+        Tuple containing the number of processed files and a list of the
+        :class:`FileRecord` objects for all files that could be associated
+        with a product.
+    """
+    records = []
+    for filename, fingerprint in files:
+        try:
+            f = FileRecord(filename, fast=fast, fingerprint=fingerprint)
+            if f.product:
+                records += [f]
+        except:
+            pass
+    return len(files), records
+
+def _resolve_records(records):
+    """
+    Determine start and end times and footprints of a list of file records.
+
+    Arguments:
+        records(:code:`list`): The :class:`FileRecord` objects to resolve.
+
+    Returns:
+        List containing tuples :code:`(start_time, end_time, footprint)`
+        for each record or None for files that could not be opened.
+    """
+    results = []
+    for f in records:
+        try:
+            f.resolve()
+        except:
+            results += [None]
+            continue
+        results += [(f.start_time, f._end_time, f.footprint)]
+    return results
+
+def _select_fields(file, fields, start=None, end=None):
+    """
+    Read fields of the profiles of an opened file within a time range.
+
+    Arguments:
+        file: The opened product file.
+        fields(:code:`list`): Names of the product attributes to read.
+        start(:code:`datetime`): If given, only profiles after start
+            are read.
+        end(:code:`datetime`): If given, only profiles before end are read.
+
+    Returns:
+        Dictionary mapping field names to the data read from the file or
+        None if the file contains no profiles within the time range.
+    """
+    view = file
+    # Only the given bounds are applied, so that no profiles are lost to
+    # rounding of the start and end times of the file.
+    if ((not start is None and start > file.start_time) or
+            (not end is None and end <= file.end_time)):
+        try:
+            view = file.select(time=(start, end))
+        except ValueError:
+            return None
+    return dict([(f, getattr(view, f)) for f in fields])
+
+def _read_fields(record, fields, start=None, end=None):
+    """
+    Read fields of the profiles of a file within a time range.
+
+    Arguments:
+        record(:class:`FileRecord`): The record of the file to read.
+        fields(:code:`list`): Names of the product attributes to read.
+        start(:code:`datetime`): If given, only profiles after start
+            are read.
+        end(:code:`datetime`): If given, only profiles before end are read.
+
+    Returns:
+        Dictionary mapping field names to the data read from the file or
+        None if the file contains no profiles within the time range.
+    """
+    file = record.open(cached=False)
+    try:
+        return _select_fields(file, fields, start, end)
+    finally:
+        file.close()
+
+def _reduce_records(records, fields, accumulator, start=None, end=None):
+    """
+    Accumulate data of a list of files.
+
+    Arguments:
+        records(:code:`list`): The :class:`FileRecord` objects of the files.
+        fields(:code:`list`): Names of the fields to read.
+        accumulator: Accumulator from :mod:`wxdata.index.accumulators`
+            whose configuration to use.
+        start(:code:`datetime`): If given, only profiles after start are
+            accumulated.
+        end(:code:`datetime`): If given, only profiles before end are
+            accumulated.
+
+    Returns:
+        Tuple containing the number of processed files, an accumulator
+        containing the partial result for the files and a list of tuples
+        :code:`(filename, error)` for the files that could not be
+        processed.
+    """
+    partial_result = accumulator.empty()
+    failed = []
+    for record in records:
+        try:
+            data = _read_fields(record, fields, start, end)
+            if not data is None:
+                partial_result.update(data)
+        except Exception as e:
+            failed += [(record.filename, "{}: {}".format(type(e).__name__, e))]
+    return len(records), partial_result, failed
+
+def _concatenate(arrays):
+    """
+    Concatenate arrays along first axis, keeping masks of masked arrays.
+    """
+    if len(arrays) == 1:
+        return arrays[0]
+    if any([isinstance(a, np.ma.MaskedArray) for a in arrays]):
+        return np.ma.concatenate(arrays)
+    return np.concatenate(arrays)
+
+def prefetch(records, depth=2, workers=2, max_bytes=None):
+    """
+    Iterate over opened product files while decompressing the following
+    files in the background.
+
+    Up to :code:`depth` files following the current one are decompressed
+    on a thread pool. Files are opened in the calling thread when they
+    are delivered, since the HDF library must not be used from several
+    threads at once. Each product is closed when the next one is
+    requested, so products must not be used after advancing the iterator.
+
+    Arguments:
+        records: Iterable of :class:`FileRecord` objects, e.g. the result
+            of :meth:`Index.get_files`.
+        depth(:code:`int`): The number of files to decompress ahead.
+        workers(:code:`int`): The number of threads used to decompress
+            files.
+        max_bytes(:code:`int`): If given, limits the disk space used by
+            the current and the decompressed upcoming files. A file is
+            always decompressed if no other file is staged, even if it
+            exceeds the limit.
+
+    Returns:
+        Generator of opened product files in the order of records.
+    """
+    records = iter(records)
+    pending = deque()
+    staged = 0
+    waiting = None
+
+    def fill(pool):
+        nonlocal staged, waiting
+        while len(pending) < depth + 1:
+            if waiting is None:
+                record = next(records, None)
+                if record is None:
+                    return
+                waiting = (record, decompressed_size(record.filename))
+            record, size = waiting
+            if (not max_bytes is None and pending and
+                    staged + size > max_bytes):
+                return
+            pending.append((record, size,
+                            pool.submit(decompress, record.filename)))
+            staged += size
+            waiting = None
+
+    product = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            fill(pool)
+            while pending:
+                record, size, future = pending[0]
+                filename, artifact = future.result()
+                try:
+                    product = record._open(filename, artifact)
+                except BaseException:
+                    if hasattr(artifact, "close"):
+                        artifact.close()
+                    raise
+                fill(pool)
+                yield product
+                product.close()
+                product = None
+                pending.popleft()
+                staged -= size
+                fill(pool)
+        finally:
+            if not product is None:
+                product.close()
+                pending.popleft()
+            for _, _, future in pending:
+                if future.cancel():
+                    continue
+                try:
+                    _, artifact = future.result()
+                except Exception:
+                    continue
+                if hasattr(artifact, "close"):
+                    artifact.close()
+
+################################################################################
+# Index
 ################################################################################
 
 class Index:
     """
     A file index holding references and meta data of different data products.
 
+    Indices loaded from disk keep a reference to the database they were
+    loaded from. Records are only read from it when they are requested, and
+    time range queries are answered directly from the database until the
+    index is modified.
+
     Attributes:
         products: List of products available from this index.
     """
@@ -106,13 +554,58 @@ class Index:
         Create an index object.
         """
         self._files = {}
+        self._time_indices = {}
+        self._spatial_indices = {}
+        self._storage = None
+        self._resolved = []
 
     @property
     def products(self):
-        return self._files.keys()
-        pass
+        products = list(self._files.keys())
+        if not self._storage is None:
+            products += [p for p in self._storage.products
+                         if not p in self._files]
+        return products
+
+    def _load_records(self, product=None):
+        """
+        Read records from the database backing this index into memory.
+
+        Arguments:
+            product(:code:`str`): Name of the product whose records to
+                read. If not given, all records are read and the index
+                is detached from the database.
+        """
+        if self._storage is None:
+            return
+        if product is None:
+            products = list(self._storage.products)
+        else:
+            products = [product]
+        for p in products:
+            if p in self._files or not p in self._storage.products:
+                continue
+            self._files[p] = self._make_records(p, self._storage.read(p))
+        if product is None:
+            self._storage.close()
+            self._storage = None
+
+    @staticmethod
+    def _make_records(product, rows):
+        """
+        Create file records from rows read from storage.
+        """
+        return [FileRecord.from_attributes(f, product, s, e, fp, fo)
+                for f, s, e, fp, fo in rows]
+
+    def _invalidate(self, product):
+        """
+        Invalidate lookup structures of a product.
+        """
+        self._time_indices.pop(product, None)
+        self._spatial_indices.pop(product, None)
 
-    def open(self, product, index):
+    def open(self, product, index, cached=False):
         """
         Open given product file.
 
@@ -121,6 +614,8 @@ class Index:
                 representing the product to select from the index.
             index(:code:`int`): Index of the file of the given type
                 to open.
+            cached(:code:`bool`): Whether to use the cache of open files.
+                See :meth:`FileRecord.open`.
 
         Returns:
             Instance of the requested product type corresponding to
@@ -138,99 +633,786 @@ class Index:
                                 .format(product))
             name = product.__name__
 
-        if not name in self._files:
+        if not name in self.products:
             raise ValueError("Product {} not available from this index."
                              .format(name))
+        self._load_records(name)
         files = self._files[name]
 
         n = len(files)
         if index >= n:
             raise ValueError("Index {} exceeds available files.")
 
-        return files[index].open()
+        return files[index].open(cached=cached)
 
 
-    def generate(self, path):
+    def generate(self, path, workers=None, chunk_size=64, fast=False):
         """
         Index file in folder tree.
 
         Recursively traverses sub-folders of the provided path and indexes
-        all known data products.
+        all known data products. Files are distributed in chunks over a
+        pool of worker processes. The resulting index is the same as the
+        one obtained by indexing the files serially.
 
         Arguments:
             path(:code:`str`): Root folder of the folder-tree to index.
+            workers(:code:`int`): The number of processes to use to
+                create the file records. Defaults to the number of CPUs.
+                Use 1 to index the files in the calling process.
+            chunk_size(:code:`int`): The number of files that are sent
+                to a worker process at once.
+            fast(:code:`bool`): If true, start times of products that
+                encode them in their filenames are taken from the filename
+                without opening the file. End times of these files are
+                determined when a query requires them or by calling
+                :meth:`resolve`.
+        """
+        if workers is None:
+            workers = os.cpu_count()
+        self._load_records()
+
+        path = os.path.expanduser(path)
+        self._index_files(_walk(path), workers, chunk_size, fast)
+
+    def update(self, path, workers=None, chunk_size=64, fast=False):
+        """
+        Update index with changes in folder tree.
+
+        Only files that are not yet in the index or whose size or
+        modification time changed since they were indexed are opened.
+        Records of files below path that no longer exist are removed
+        from the index.
+
+        Arguments:
+            path(:code:`str`): Root folder of the folder-tree to update.
+            workers(:code:`int`): The number of processes to use to
+                create the file records. Defaults to the number of CPUs.
+            chunk_size(:code:`int`): The number of files that are sent
+                to a worker process at once.
+            fast(:code:`bool`): Whether to take start times from filenames.
+                See :meth:`generate`.
         """
+        if workers is None:
+            workers = os.cpu_count()
+        self._load_records()
+
         path = os.path.expanduser(path)
-        files = glob.glob(os.path.join(path, "**", "*"), recursive=True)
-        print("Found {} files.".format(len(files)))
-        for f in tqdm(files):
-            try:
-                f = FileRecord(f)
-                if f.product:
+        root = os.path.join(os.path.abspath(path), "")
+
+        existing = {}
+        for k in self._files:
+            for f in self._files[k]:
+                filename = os.path.abspath(f.filename)
+                if filename.startswith(root):
+                    existing[filename] = f
+
+        unchanged = set()
+        def modified_files():
+            for filename, fingerprint in _walk(path):
+                name = os.path.abspath(filename)
+                f = existing.get(name)
+                if f and getattr(f, "fingerprint", None) == fingerprint:
+                    unchanged.add(name)
+                    continue
+                yield filename, fingerprint
+
+        self._index_files(modified_files(), workers, chunk_size, fast)
+
+        stale = set([id(f) for n, f in existing.items()
+                     if not n in unchanged])
+        for k in list(self._files):
+            records = [f for f in self._files[k] if not id(f) in stale]
+            if records:
+                self._files[k] = records
+            else:
+                del self._files[k]
+            self._invalidate(k)
+
+    def resolve(self, workers=None, chunk_size=64):
+        """
+        Determine start and end times and footprints of all records that
+        were created from filenames. The records are sorted again, since
+        the start times taken from filenames are truncated to seconds.
+        Records of files that can't be read are removed from the index.
+
+        Arguments:
+            workers(:code:`int`): The number of processes to use to
+                open the files. Defaults to the number of CPUs.
+            chunk_size(:code:`int`): The number of files that are sent
+                to a worker process at once.
+        """
+        if workers is None:
+            workers = os.cpu_count()
+        self._load_records()
+
+        records = [f for k in self._files for f in self._files[k]
+                   if not f.end_time_resolved]
+        chunks = list(_chunks(records, chunk_size))
+        failed = set()
+        with tqdm(total=len(records)) as progress:
+            results = _parallel_map(_resolve_records, chunks, workers)
+            for chunk, resolved in zip(chunks, results):
+                for f, result in zip(chunk, resolved):
+                    if result is None:
+                        failed.add(id(f))
+                    else:
+                        f.start_time, f.end_time, f.footprint = result
+                progress.update(len(chunk))
+        self._remove_records(failed)
+        for k in self._files:
+            self._sort(k)
+
+    def _remove_records(self, ids):
+        """
+        Remove records from the index.
+
+        Arguments:
+            ids(:code:`set`): The ids of the :class:`FileRecord` objects
+                to remove.
+        """
+        if not ids:
+            return
+        for k in list(self._files):
+            records = [f for f in self._files[k] if not id(f) in ids]
+            if records:
+                self._files[k] = records
+            else:
+                del self._files[k]
+            self._invalidate(k)
+
+    def _resolve(self, record):
+        """
+        Resolve record during a query.
+
+        Records resolved during a query are collected and applied to the
+        index by :meth:`_apply_resolved` once the query has finished.
+
+        Arguments:
+            record(:class:`FileRecord`): The record to resolve.
+
+        Returns:
+            False if the file of the record can't be read, True otherwise.
+        """
+        try:
+            record.resolve()
+        except Exception:
+            self._resolved += [(record, False)]
+            return False
+        self._resolved += [(record, True)]
+        return True
+
+    def _apply_resolved(self):
+        """
+        Remove records that failed to resolve during a query from the index
+        and sort the records of products whose records were resolved.
+
+        Returns:
+            Whether any records were resolved.
+        """
+        resolved, self._resolved = self._resolved, []
+        if not resolved:
+            return False
+        self._remove_records(set([id(f) for f, ok in resolved if not ok]))
+        for k in set([f.product for f, _ in resolved]):
+            if k in self._files:
+                self._sort(k)
+        return True
+
+    def _index_files(self, files, workers, chunk_size, fast=False):
+        """
+        Create records for the given files and add them to the index.
+
+        Arguments:
+            files: Iterable of tuples :code:`(filename, fingerprint)` of
+                the files to index.
+            workers(:code:`int`): The number of processes to use.
+            chunk_size(:code:`int`): The number of files that are sent
+                to a worker process at once.
+            fast(:code:`bool`): Whether to take start times from filenames.
+        """
+        chunks = _chunks(files, chunk_size)
+        create_records = partial(_create_records, fast=fast)
+        modified = set()
+        with tqdm(unit=" files") as progress:
+            for n, records in _parallel_map(create_records, chunks, workers):
+                for f in records:
                     if not f.product in self._files:
                         self._files[f.product] = []
                     self._files[f.product] += [f]
-            except:
-                pass
+                    modified.add(f.product)
+                progress.update(n)
+        for k in modified:
+            self._sort(k)
+
+    def _sort(self, product):
+        """
+        Sort records of product by start time and invalidate lookup
+        structures.
 
-    def get_files(self, product, start=None, end=None):
+        Arguments:
+            product(:code:`str`): Name of the product whose records to sort.
+        """
+        self._files[product].sort(key=lambda f: f.start_time)
+        self._invalidate(product)
+
+    def _get_time_index(self, product):
+        """
+        Lookup structure for time range queries.
+
+        Since records are sorted by start time, the records overlapping
+        with a time range are found by bisecting the start times for the
+        end of the range and the running maximum of the end times for
+        the start of the range. For records whose end time hasn't been
+        resolved, its upper bound is used.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+
+        Returns:
+            Tuple :code:`(starts, max_ends)` containing the start times
+            of the records and the running maximum of their end times.
+        """
+        if not product in self._time_indices:
+            files = self._files[product]
+            starts = [f.start_time for f in files]
+            max_ends = list(accumulate((f.max_end_time for f in files), max))
+            self._time_indices[product] = (starts, max_ends)
+        return self._time_indices[product]
+
+    def _get_spatial_index(self, product):
+        """
+        Lookup structure for spatial queries.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+
+        Returns:
+            Tuple :code:`(tree, missing)` containing a :class:`BoxTree`
+            over the footprints of the records identified by their position
+            in the list of records, and the positions of the records
+            without footprint.
+        """
+        if not product in self._spatial_indices:
+            files = self._files[product]
+            boxes, ids, missing = [], [], []
+            for i, f in enumerate(files):
+                if f.footprint is None:
+                    missing += [i]
+                else:
+                    boxes += [f.footprint]
+                    ids += [np.full(len(f.footprint), i)]
+            if boxes:
+                tree = BoxTree(np.concatenate(boxes), np.concatenate(ids))
+            else:
+                tree = None
+            self._spatial_indices[product] = (tree, missing)
+        return self._spatial_indices[product]
+
+    def get_files(self, product, start=None, end=None, region=None):
+        """
+        Get files of a product within a given time range and region.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            start(:code:`datetime`): If given, only files with an end time
+                later than or equal to start are returned.
+            end(:code:`datetime`): If given, only files with a start time
+                earlier than end are returned.
+            region: If given, only files whose footprint intersects the
+                region are returned. Can be a
+                :class:`wxdata.index.spatial.BoundingBox` or
+                :class:`wxdata.index.spatial.Polygon` object or a tuple
+                :code:`(lon_min, lat_min, lon_max, lat_max)`. Files without
+                footprint are opened to compute it. Files for which no
+                footprint can be computed are always returned.
+
+        Returns:
+            List of the :class:`FileRecord` objects of the requested files
+            sorted by start time.
+        """
         if not product in self.products:
             raise ValueError("{} is not available from this index. Available"
-                             " products are {}.".format(self.products))
+                             " products are {}.".format(product,
+                                                        list(self.products)))
 
         if not (isinstance(start, datetime) or start is None):
             raise ValueError("start keyword argument must be a datetime object "
                              " or None.")
 
-        if not (isinstance(end, datetime) or start is None):
+        if not (isinstance(end, datetime) or end is None):
             raise ValueError("end keyword argument must be a datetime object "
                              " or None.")
 
+        if not product in self._files:
+            if (start is None and end is None) or not region is None:
+                self._load_records(product)
+            else:
+                files = self._make_records(product,
+                                           self._storage.query(product,
+                                                               start,
+                                                               end))
+                if all([f.end_time_resolved for f in files]):
+                    return [f for f in files if self._ends_after(f, start)]
+                # Records are resolved in memory, so that files are only
+                # opened once.
+                self._load_records(product)
+
         files = self._files[product]
-        if start is None and end is None:
+        if start is None and end is None and region is None:
             return files
 
-        in_range = []
-        for f in files:
-            if not start is None and f.end_time >= start:
-                if not end is None and f.start_time < end:
-                    in_range += [f]
+        i_start = 0
+        i_end = len(files)
+        if not (start is None and end is None):
+            starts, max_ends = self._get_time_index(product)
+            if not start is None:
+                i_start = bisect_left(max_ends, start)
+            if not end is None:
+                i_end = bisect_left(starts, end)
+
+        if region is None:
+            result = [f for f in files[i_start:i_end]
+                      if self._ends_after(f, start)]
+        else:
+            region = to_region(region)
+            tree, missing = self._get_spatial_index(product)
+            candidates = set(missing)
+            if not tree is None:
+                for box in region.boxes():
+                    candidates.update(tree.query(box).tolist())
+            candidates = sorted([i for i in candidates
+                                 if i_start <= i < i_end])
+            result = [files[i] for i in candidates
+                      if self._ends_after(files[i], start)
+                      and self._intersects(files[i], region)]
+
+        if self._apply_resolved():
+            result.sort(key=lambda f: f.start_time)
+        return result
+
+    def _intersects(self, record, region):
+        """
+        Whether the footprint of a record intersects a region. Records
+        whose footprint is missing are resolved if their end time is
+        missing as well. Records without geolocation always intersect,
+        records of files that can't be read never do.
+        """
+        if record.footprint is None and not record.end_time_resolved:
+            if not self._resolve(record):
+                return False
+        if record.footprint is None:
+            return True
+        return region.intersects(record.footprint).any()
+
+    def _ends_after(self, record, start):
+        """
+        Whether a record ends after the given time. The end time of the
+        record is only resolved if this can't be determined from its
+        start time and the upper bound of its end time. Records of files
+        that can't be read never end after the given time.
+        """
+        if start is None or record.start_time >= start:
+            return True
+        if record.max_end_time < start:
+            return False
+        if not record.end_time_resolved and not self._resolve(record):
+            return False
+        return record.end_time >= start
+
+    def match(self, products, tolerance=timedelta(0), start=None, end=None):
+        """
+        Find files of different products that overlap in time.
+
+        The records of all products are merged by start time and swept
+        once, while keeping track of the records whose time range may
+        still overlap with records further on.
+
+        Arguments:
+            products(:code:`list`): Names of the products to match. Files
+                of the other products are matched to the files of the
+                first product.
+            tolerance(:code:`timedelta`): Time by which files may be apart
+                and still be matched.
+            start(:code:`datetime`): If given, only files of the first
+                product ending after start are matched.
+            end(:code:`datetime`): If given, only files of the first
+                product starting before end are matched.
+
+        Returns:
+            Generator of tuples containing one :class:`FileRecord` per
+            product, ordered by the start time of the file of the first
+            product. If a file of the first product overlaps with several
+            files of another product, a tuple is generated for each
+            combination. Files of the first product without overlapping
+            files of every other product are skipped.
+        """
+        if len(products) < 2:
+            raise ValueError("At least two products are required for "
+                             "matching.")
+
+        primaries = self.get_files(products[0], start, end)
+        if not primaries:
+            return
+        t0, t1 = None, None
+        if not start is None:
+            t0 = primaries[0].start_time - tolerance
+        if not end is None:
+            # The end of a time range is exclusive in get_files.
+            t1 = max([f.max_end_time for f in primaries]) + tolerance
+            t1 += timedelta(microseconds=1)
+
+        sources = [[(f.start_time, 0, f) for f in primaries]]
+        for i, p in enumerate(products[1:], 1):
+            files = self.get_files(p, t0, t1)
+            sources += [[(f.start_time, i, f) for f in files]]
+
+        # Active entries per product. For the first product, entries are
+        # lists holding the record and its matches for every other product.
+        active = [[] for p in products]
+        pending = deque()
+
+        def expired(record, time):
+            return record.max_end_time + tolerance < time
+
+        def overlaps(record, time):
+            return self._ends_after(record, time - tolerance)
+
+        # Records resolved during the sweep are applied to the index once
+        # it has finished.
+        try:
+            for time, i, f in merge(*sources, key=lambda x: x[:2]):
+                for j in range(len(products)):
+                    if j == 0:
+                        active[j] = [e for e in active[j]
+                                     if not expired(e[0], time)]
+                    else:
+                        active[j] = [a for a in active[j]
+                                     if not expired(a, time)]
 
-        return in_range
+                while pending and expired(pending[0][0], time):
+                    yield from self._match_tuples(pending.popleft())
+
+                if i == 0:
+                    entry = [f] + [[] for p in products[1:]]
+                    for j in range(1, len(products)):
+                        entry[j] = [a for a in active[j] if overlaps(a, time)]
+                    active[0] += [entry]
+                    pending.append(entry)
+                else:
+                    for entry in active[0]:
+                        if overlaps(entry[0], time):
+                            entry[i] += [f]
+                    active[i] += [f]
+
+            while pending:
+                yield from self._match_tuples(pending.popleft())
+        finally:
+            self._apply_resolved()
+
+    def stream(self, product, start, end, fields, chunk_profiles=1000):
+        """
+        Iterate over profiles of consecutive files in chunks.
+
+        Profiles of all files of the product within the time range are
+        returned in time order as chunks with a fixed number of profiles,
+        regardless of the file boundaries. While a chunk is processed, the
+        next file is decompressed in a background thread using
+        :func:`prefetch`. The fields are read in the calling thread, since
+        the HDF library must not be used from several threads at once.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            start(:code:`datetime`): Start of the time range or None.
+            end(:code:`datetime`): End of the time range or None.
+            fields(:code:`list`): Names of the product attributes to read.
+                The fields must have profiles along their first axis.
+            chunk_profiles(:code:`int`): The number of profiles per chunk.
+
+        Returns:
+            Generator of dictionaries mapping field names to arrays with
+            :code:`chunk_profiles` profiles. The last chunk may be shorter.
+        """
+        records = self.get_files(product, start, end)
+        buffers = dict([(f, []) for f in fields])
+        n_buffered = 0
+
+        files = prefetch(records, depth=1, workers=1)
+        try:
+            for file in files:
+                data = _select_fields(file, fields, start, end)
+                if data is None:
+                    continue
+
+                for f in fields:
+                    buffers[f] += [data[f]]
+                n_buffered += len(data[fields[0]])
+                del data
+
+                while n_buffered >= chunk_profiles:
+                    chunk = {}
+                    for f in fields:
+                        array = _concatenate(buffers[f])
+                        chunk[f] = array[:chunk_profiles]
+                        buffers[f] = [array[chunk_profiles:]]
+                    n_buffered -= chunk_profiles
+                    yield chunk
+        finally:
+            files.close()
+
+        if n_buffered > 0:
+            yield dict([(f, _concatenate(buffers[f])) for f in fields])
+
+    def reduce(self, product, start, end, fields, accumulator, workers=None,
+               chunk_size=4):
+        """
+        Compute statistics over the files of a product in parallel.
+
+        Each worker process accumulates the data of a subset of the files
+        in a copy of the given accumulator. The partial results are then
+        merged into the final result.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            start(:code:`datetime`): Start of the time range or None.
+            end(:code:`datetime`): End of the time range or None.
+            fields(:code:`list`): Names of the fields to read. If None,
+                the fields required by the accumulator are read.
+            accumulator: Accumulator from :mod:`wxdata.index.accumulators`
+                defining the statistics to compute.
+            workers(:code:`int`): The number of processes to use.
+                Defaults to the number of CPUs.
+            chunk_size(:code:`int`): The number of files that are sent to
+                a worker process at once.
+
+        Returns:
+            Tuple containing the accumulator with the combined result and
+            a list of tuples :code:`(filename, error)` describing the files
+            that could not be processed.
+        """
+        if workers is None:
+            workers = os.cpu_count()
+        if fields is None:
+            fields = accumulator.fields
+        fields = list(dict.fromkeys(list(fields) + list(accumulator.fields)))
+        records = self.get_files(product, start, end)
+        reduce_records = partial(_reduce_records,
+                                 fields=fields,
+                                 accumulator=accumulator,
+                                 start=start,
+                                 end=end)
+        result = accumulator.empty()
+        failed = []
+        with tqdm(total=len(records), unit=" files") as progress:
+            for n, partial_result, errors in _parallel_map(
+                    reduce_records, _chunks(records, chunk_size), workers):
+                result.merge(partial_result)
+                failed += errors
+                progress.update(n)
+        return result, failed
+
+    def find_overpasses(self, product, stations, radius, start=None, end=None,
+                        workers=None, chunk_size=4):
+        """
+        Find overpasses of ground stations.
+
+        The profiles of each file are stored in a KD-tree over their
+        coordinates on the unit sphere, which is queried for the profiles
+        within the given distance of each station. Files are processed in
+        parallel.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            stations: Sequence of :code:`(lon, lat)` pairs with the
+                coordinates of the stations.
+            radius(:code:`float`): The maximum distance between a profile
+                and a station in kilometers.
+            start(:code:`datetime`): Start of the time range or None.
+            end(:code:`datetime`): End of the time range or None.
+            workers(:code:`int`): The number of processes to use.
+                Defaults to the number of CPUs.
+            chunk_size(:code:`int`): The number of files that are sent to
+                a worker process at once.
+
+        Returns:
+            Tuple containing a list with one list of overpasses for each
+            station and a list of tuples :code:`(filename, error)`
+            describing the files that could not be processed. Overpasses
+            are tuples :code:`(filename, profiles, distance)` containing
+            the file, the indices of the profiles within the given
+            distance of the station and the distance of the closest
+            profile in kilometers.
+        """
+        if workers is None:
+            workers = os.cpu_count()
+        stations = np.asarray(stations, dtype=np.float64).reshape(-1, 2)
+        vectors = to_unit_vectors(stations[:, 0], stations[:, 1])
+        records = self.get_files(product, start, end)
+        find_overpasses = partial(_find_overpasses,
+                                  stations=vectors,
+                                  radius=radius)
+        results = [[] for _ in range(len(stations))]
+        failed = []
+        with tqdm(total=len(records), unit=" files") as progress:
+            for n, overpasses, errors in _parallel_map(
+                    find_overpasses, _chunks(records, chunk_size), workers):
+                for station, filename, profiles, distance in overpasses:
+                    results[station] += [(filename, profiles, distance)]
+                failed += errors
+                progress.update(n)
+        return results, failed
+
+    def generate_overviews(self, product, field, directory, start=None,
+                           end=None, levels=5, workers=None, chunk_size=4):
+        """
+        Generate downsampled overviews of a field for the files of a
+        product.
+
+        Overviews of files that haven't changed since their overviews were
+        generated are not recomputed.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            field(:code:`str`): Name of the field, e.g.
+                :code:`"radar_reflectivity"`.
+            directory(:code:`str`): Folder to store the overviews in,
+                usually next to the stored index.
+            start(:code:`datetime`): Start of the time range or None.
+            end(:code:`datetime`): End of the time range or None.
+            levels(:code:`int`): The number of levels to compute. See
+                :mod:`wxdata.index.overviews`.
+            workers(:code:`int`): The number of processes to use.
+                Defaults to the number of CPUs.
+            chunk_size(:code:`int`): The number of files that are sent to
+                a worker process at once.
+
+        Returns:
+            List of tuples :code:`(filename, error)` describing the files
+            that could not be processed.
+        """
+        if workers is None:
+            workers = os.cpu_count()
+        records = self.get_files(product, start, end)
+        generate = partial(_generate_overviews,
+                           product=product,
+                           field=field,
+                           directory=directory,
+                           levels=levels)
+        failed = []
+        with tqdm(total=len(records), unit=" files") as progress:
+            for n, errors in _parallel_map(generate,
+                                           _chunks(records, chunk_size),
+                                           workers):
+                failed += errors
+                progress.update(n)
+        return failed
+
+    def read_overviews(self, product, field, directory, start=None, end=None,
+                       resolution=None):
+        """
+        Read overviews of a field.
+
+        For each file, the coarsest level whose blocks contain at most
+        the requested number of profiles and range bins is read. If no
+        overview satisfies the resolution or the overviews of a file
+        haven't been generated, the field is read at full resolution.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            field(:code:`str`): Name of the field.
+            directory(:code:`str`): Folder containing the overviews.
+            start(:code:`datetime`): Start of the time range or None.
+            end(:code:`datetime`): End of the time range or None.
+            resolution: Tuple :code:`(profiles, bins)` with the largest
+                acceptable block size. If None, the coarsest level is read.
+
+        Returns:
+            List of tuples :code:`(record, overview)`, where overview is a
+            dictionary containing the block size and the arrays
+            :code:`mean`, :code:`max` and :code:`valid_fraction`.
+        """
+        results = []
+        for record in self.get_files(product, start, end):
+            path = overview_path(directory, product, field, record.filename)
+            overview = None
+            if read_fingerprint(path) == file_fingerprint(record.filename):
+                overview = read_overview(path, resolution)
+            if overview is None:
+                file = record.open(cached=False)
+                try:
+                    overview = full_resolution(getattr(file, field))
+                finally:
+                    file.close()
+            results += [(record, overview)]
+        return results
+
+    @staticmethod
+    def _match_tuples(entry):
+        """
+        Tuples of matching records for an entry of the sweep in
+        :meth:`match`.
+        """
+        for matches in combinations(*entry[1:]):
+            yield (entry[0],) + matches
+
+    def write_matches(self, filename, products, tolerance=timedelta(0),
+                      start=None, end=None):
+        """
+        Write matching files to a text file.
+
+        Matches are written as they are found, with the tab-separated
+        filenames of each matching tuple on one line.
+
+        Arguments:
+            filename(:code:`str`): The file to write the matches to.
+            products(:code:`list`): Names of the products to match.
+            tolerance(:code:`timedelta`): See :meth:`match`.
+            start(:code:`datetime`): See :meth:`match`.
+            end(:code:`datetime`): See :meth:`match`.
+
+        Returns:
+            The number of matches written to the file.
+        """
+        n = 0
+        with open(os.path.expanduser(filename), "w") as output:
+            for records in self.match(products, tolerance, start, end):
+                output.write("\t".join([f.filename for f in records]) + "\n")
+                n += 1
+        return n
 
     def store(self, filename):
         """
         Store index to disc.
 
+        The index is stored as an SQLite database. Filenames are stored
+        relative to the folder containing the database. Times and
+        footprints of records that were resolved by queries are stored as
+        well, so that their files aren't opened again after loading.
+
         Arguments:
             filename(:code:`str`): Filename to which to store the index.
         """
+        self._load_records()
         filename = os.path.expanduser(filename)
-        dir = os.path.abspath(os.path.dirname(filename))
-
-        index = deepcopy(self)
-        for k in index._files:
-            for f in index._files[k]:
-                f.make_relative(dir)
-
-        pickle.dump(index, open(filename, "wb"))
+        SqliteStorage.write(filename, self._files)
 
     @staticmethod
     def load(filename):
         """
         Load index from disc.
 
+        Indices in SQLite format are opened without reading any records.
+        Indices in the legacy pickle format are read completely. Use
+        :func:`wxdata.index.storage.convert` to convert them.
+
         Arguments:
             filename(:code:`str`): Filename from which to load the index.
         """
         filename = os.path.expanduser(filename)
-        dir = os.path.abspath(os.path.dirname(filename))
-        index =  pickle.load(open(filename, "rb"))
-
-        for k in index._files:
-            for f in index._files[k]:
-                f.make_absolute(dir)
-
+        if not is_sqlite(filename):
+            return load_pickle(filename)
+        index = Index()
+        index._storage = SqliteStorage(filename)
         return index
 
     def __repr__(self):
@@ -238,6 +1420,10 @@ class Index:
         s += "\nAvailable products:"
         for p in self.products:
             s += "\n\t" + p
-            s += " (" + str(len(self._files[p])) + ")"
+            if p in self._files:
+                n = len(self._files[p])
+            else:
+                n = self._storage.products[p]
+            s += " (" + str(n) + ")"
         s += "\n"
         return s
@@ -0,0 +1,247 @@
+"""
+Mergeable accumulators for statistics over many files.
+
+Accumulators are used with :meth:`wxdata.index.Index.reduce`. Each
+worker process updates its own copy of the accumulator with the data of
+the files it processes and the partial results are then merged into the
+final result. All accumulators ignore masked and non-finite values.
+"""
+from abc import ABCMeta, abstractmethod
+from copy import deepcopy
+
+import numpy as np
+
+def _values(data, field):
+    """
+    Get values of field as float array together with the mask of valid
+    values.
+    """
+    values = data[field]
+    valid = ~np.ma.getmaskarray(values)
+    values = np.asarray(np.ma.getdata(values), dtype=np.float64)
+    valid &= np.isfinite(values)
+    return values, valid
+
+def _broadcast(values, shape):
+    """
+    Broadcast values along the leading axes of a given shape, e.g.
+    per-profile latitudes to a field with values for each range bin.
+    """
+    values = np.asarray(values)
+    values = values.reshape(values.shape + (1,) * (len(shape) - values.ndim))
+    return np.broadcast_to(values, shape)
+
+class Accumulator(metaclass=ABCMeta):
+    """
+    Base class for accumulators.
+
+    Attributes:
+        fields(:code:`list`): The names of the fields the accumulator
+            requires.
+    """
+    fields = []
+
+    def empty(self):
+        """
+        Create an accumulator with the same configuration that hasn't
+        accumulated any data yet.
+        """
+        accumulator = deepcopy(self)
+        accumulator._reset()
+        return accumulator
+
+    @abstractmethod
+    def _reset(self):
+        """
+        Discard the accumulated data.
+        """
+        pass
+
+    @abstractmethod
+    def update(self, data):
+        """
+        Accumulate data.
+
+        Arguments:
+            data(:code:`dict`): Dictionary mapping field names to the data
+                of a file.
+        """
+        pass
+
+    @abstractmethod
+    def merge(self, other):
+        """
+        Merge another accumulator of the same configuration into this one.
+
+        Arguments:
+            other: The accumulator to merge.
+
+        Returns:
+            This accumulator.
+        """
+        pass
+
+class Count(Accumulator):
+    """
+    Counts the profiles or the valid values of a field.
+
+    Attributes:
+        count(:code:`int`): The accumulated count.
+    """
+    def __init__(self, field):
+        """
+        Arguments:
+            field(:code:`str`): The field whose valid values to count. The
+                number of profiles is counted as the length of the field.
+        """
+        self.field = field
+        self.fields = [field]
+        self._reset()
+
+    def _reset(self):
+        self.profiles = 0
+        self.count = 0
+
+    def update(self, data):
+        _, valid = _values(data, self.field)
+        self.profiles += len(valid)
+        self.count += int(np.count_nonzero(valid))
+
+    def merge(self, other):
+        self.profiles += other.profiles
+        self.count += other.count
+        return self
+
+class Histogram(Accumulator):
+    """
+    One- or two-dimensional histogram.
+
+    A two-dimensional histogram of radar reflectivity and altitude, for
+    example, yields a CFAD (contoured frequency by altitude diagram).
+    Values of the second field are broadcast along the leading axes of the
+    first, so that per-profile fields such as latitude can be combined
+    with fields that have values for each range bin.
+
+    Attributes:
+        counts(:code:`numpy.ndarray`): The accumulated counts.
+    """
+    def __init__(self, field, bins, y=None, y_bins=None):
+        """
+        Arguments:
+            field(:code:`str`): The field to compute the histogram of.
+            bins(:code:`numpy.ndarray`): The bin edges for the field.
+            y(:code:`str`): Optional second field.
+            y_bins(:code:`numpy.ndarray`): The bin edges for the second
+                field.
+        """
+        self.field = field
+        self.bins = np.asarray(bins, dtype=np.float64)
+        self.y = y
+        self.fields = [field]
+        if not y is None:
+            self.y_bins = np.asarray(y_bins, dtype=np.float64)
+            self.fields += [y]
+        self._reset()
+
+    def _reset(self):
+        if self.y is None:
+            self.counts = np.zeros(len(self.bins) - 1, dtype=np.int64)
+        else:
+            self.counts = np.zeros((len(self.bins) - 1, len(self.y_bins) - 1),
+                                   dtype=np.int64)
+
+    def update(self, data):
+        x, valid = _values(data, self.field)
+        if self.y is None:
+            counts, _ = np.histogram(x[valid], bins=self.bins)
+        else:
+            y, y_valid = _values(data, self.y)
+            y = _broadcast(y, x.shape)
+            valid &= _broadcast(y_valid, x.shape)
+            counts, _, _ = np.histogram2d(x[valid], y[valid],
+                                          bins=[self.bins, self.y_bins])
+        self.counts += counts.astype(np.int64)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+class Moments(Accumulator):
+    """
+    Running mean and variance of a field.
+
+    Values can be grouped by the bins of a second field, e.g. latitude to
+    compute zonal means. Partial results are merged using the parallel
+    algorithm of Chan et al., so that results don't depend on how files
+    are distributed over processes.
+
+    Attributes:
+        count(:code:`numpy.ndarray`): The number of values in each group.
+        mean(:code:`numpy.ndarray`): The mean of each group.
+    """
+    def __init__(self, field, by=None, bins=None):
+        """
+        Arguments:
+            field(:code:`str`): The field to compute the moments of.
+            by(:code:`str`): Optional field to group values by.
+            bins(:code:`numpy.ndarray`): Bin edges of the groups.
+        """
+        self.field = field
+        self.by = by
+        self.fields = [field]
+        if not by is None:
+            self.bins = np.asarray(bins, dtype=np.float64)
+            self.fields += [by]
+        self._reset()
+
+    def _reset(self):
+        n_groups = 1
+        if not self.by is None:
+            n_groups = len(self.bins) - 1
+        self.count = np.zeros(n_groups, dtype=np.int64)
+        self.mean = np.zeros(n_groups, dtype=np.float64)
+        self._m2 = np.zeros(n_groups, dtype=np.float64)
+
+    @property
+    def variance(self):
+        """
+        The sample variance of each group.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > 1,
+                            self._m2 / (self.count - 1),
+                            np.nan)
+
+    def _combine(self, count, mean, m2):
+        n = self.count + count
+        delta = mean - self.mean
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.mean = np.where(n > 0, self.mean + delta * count / n, 0.0)
+            m2 = self._m2 + m2 + delta ** 2 * self.count * count / n
+            self._m2 = np.where(n > 0, m2, 0.0)
+        self.count = n
+
+    def update(self, data):
+        x, valid = _values(data, self.field)
+        if self.by is None:
+            groups = np.zeros(x.shape, dtype=np.int64)
+        else:
+            by, by_valid = _values(data, self.by)
+            by = _broadcast(by, x.shape)
+            valid &= _broadcast(by_valid, x.shape)
+            groups = np.digitize(by, self.bins) - 1
+            valid &= (groups >= 0) & (groups < len(self.count))
+        x, groups = x[valid], groups[valid]
+
+        n_groups = len(self.count)
+        count = np.bincount(groups, minlength=n_groups)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.bincount(groups, weights=x, minlength=n_groups) / count
+        mean[count == 0] = 0.0
+        m2 = np.bincount(groups, weights=(x - mean[groups]) ** 2,
+                         minlength=n_groups)
+        self._combine(count, mean, m2)
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other._m2)
+        return self
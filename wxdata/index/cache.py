@@ -0,0 +1,150 @@
+"""
+Cache of open product files.
+
+Opening a product file requires decompressing it and opening its HDF
+interfaces. The :class:`HandleCache` keeps recently used product files
+open, so that repeated calls to :meth:`wxdata.index.FileRecord.open` with
+:code:`cached=True` for the same file return the same object.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+class HandleCache:
+    """
+    Thread-safe LRU cache of open product files.
+
+    Files are evicted when the number of open files or the total size of
+    the opened files exceeds the configured limits. Evicted files are
+    closed immediately, so product objects obtained from the cache must
+    not be used after they have been evicted.
+
+    Attributes:
+        max_handles(:code:`int`): The maximum number of open files. Must
+            be at least one.
+        max_bytes(:code:`int`): The maximum total size of the opened files
+            or None for no limit. For compressed files, the size of the
+            decompressed file is used.
+        hits(:code:`int`): The number of lookups that found an open file.
+        misses(:code:`int`): The number of lookups that had to open the
+            file.
+        evictions(:code:`int`): The number of files that were evicted.
+    """
+    def __init__(self, max_handles=16, max_bytes=None):
+        """
+        Arguments:
+            max_handles(:code:`int`): The maximum number of open files.
+                Must be at least one.
+            max_bytes(:code:`int`): The maximum total size of the opened
+                files or None for no limit.
+        """
+        if max_handles < 1:
+            raise ValueError("The cache must hold at least one file. Use "
+                             "cached=False to open files without caching.")
+        self.max_handles = max_handles
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._handles = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._handles)
+
+    @property
+    def stats(self):
+        """
+        Dictionary containing the cache statistics.
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "handles": len(self._handles),
+                    "bytes": self._bytes}
+
+    def get(self, key, open):
+        """
+        Get open file from cache.
+
+        Arguments:
+            key: The key identifying the file.
+            open: Function without arguments that opens the file if it
+                is not in the cache.
+
+        Returns:
+            The opened product file.
+        """
+        with self._lock:
+            if key in self._handles:
+                product, _ = self._handles[key]
+                if not product.closed:
+                    self._handles.move_to_end(key)
+                    self.hits += 1
+                    return product
+                self._remove(key)
+            self.misses += 1
+
+        product = open()
+        try:
+            size = os.path.getsize(product.filename)
+        except OSError:
+            size = 0
+
+        with self._lock:
+            if key in self._handles:
+                cached, _ = self._handles[key]
+                if not cached.closed:
+                    product.close()
+                    return cached
+                self._remove(key)
+            self._handles[key] = (product, size)
+            self._bytes += size
+            self._evict()
+        return product
+
+    def _remove(self, key):
+        product, size = self._handles.pop(key)
+        self._bytes -= size
+        return product
+
+    def _evict(self):
+        """
+        Close least recently used files until limits are satisfied.
+        """
+        while self._handles:
+            n = len(self._handles)
+            too_many = n > self.max_handles
+            too_large = (not self.max_bytes is None and
+                         self._bytes > self.max_bytes and n > 1)
+            if not (too_many or too_large):
+                break
+            key = next(iter(self._handles))
+            self._remove(key).close()
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Close and remove file from the cache.
+
+        Arguments:
+            key: The key identifying the file.
+        """
+        with self._lock:
+            if key in self._handles:
+                self._remove(key).close()
+
+    def clear(self):
+        """
+        Close all files in the cache.
+        """
+        with self._lock:
+            while self._handles:
+                _, (product, _) = self._handles.popitem(last=False)
+                product.close()
+            self._bytes = 0
+
+# Cache used by :meth:`wxdata.index.FileRecord.open`.
+handles = HandleCache()
@@ -0,0 +1,94 @@
+"""
+Overpasses of ground stations.
+
+Finds the profiles of a product that lie within a given distance of a
+set of ground stations. Locations are converted to points on the unit
+sphere, so that distances can be found with a KD-tree over Euclidean
+coordinates: two points are within great-circle distance :code:`d` of
+each other if the chord between them is shorter than
+:code:`2 * sin(d / (2 * R))`.
+"""
+import numpy as np
+
+# Mean radius of the Earth in kilometers.
+EARTH_RADIUS = 6371.0
+
+def to_unit_vectors(longitude, latitude):
+    """
+    Convert longitudes and latitudes to points on the unit sphere.
+
+    Arguments:
+        longitude(:code:`numpy.ndarray`): The longitudes in degrees.
+        latitude(:code:`numpy.ndarray`): The latitudes in degrees.
+
+    Returns:
+        Array of shape :code:`(n, 3)` containing the Cartesian coordinates
+        of the points.
+    """
+    lon = np.radians(np.asarray(longitude, dtype=np.float64).ravel())
+    lat = np.radians(np.asarray(latitude, dtype=np.float64).ravel())
+    return np.stack([np.cos(lat) * np.cos(lon),
+                     np.cos(lat) * np.sin(lon),
+                     np.sin(lat)], axis=1)
+
+def chord_length(distance):
+    """
+    Convert great-circle distance in kilometers to chord length on the
+    unit sphere.
+    """
+    return 2.0 * np.sin(np.minimum(distance / (2.0 * EARTH_RADIUS),
+                                   np.pi / 2.0))
+
+def great_circle_distance(chord):
+    """
+    Convert chord length on the unit sphere to great-circle distance in
+    kilometers.
+    """
+    return 2.0 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2.0, 1.0))
+
+def _find_overpasses(records, stations, radius):
+    """
+    Find overpasses in a list of files.
+
+    Arguments:
+        records(:code:`list`): The :class:`wxdata.index.FileRecord` objects
+            of the files to search.
+        stations(:code:`numpy.ndarray`): Unit vectors of the stations.
+        radius(:code:`float`): The maximum distance in kilometers.
+
+    Returns:
+        Tuple containing the number of processed files, a list of tuples
+        :code:`(station, filename, profiles, distance)` for all overpasses
+        and a list of tuples :code:`(filename, error)` for the files that
+        could not be processed.
+    """
+    from scipy.spatial import cKDTree
+    r = chord_length(radius)
+    overpasses = []
+    failed = []
+    for record in records:
+        try:
+            file = record.open(cached=False)
+            try:
+                track = to_unit_vectors(file.longitude, file.latitude)
+            finally:
+                file.close()
+        except Exception as e:
+            failed += [(record.filename, "{}: {}".format(type(e).__name__, e))]
+            continue
+        valid = np.all(np.isfinite(track), axis=1)
+        indices = np.where(valid)[0]
+        if indices.size == 0:
+            continue
+        tree = cKDTree(track[indices])
+        for station, hits in enumerate(tree.query_ball_point(stations, r)):
+            if not hits:
+                continue
+            profiles = np.sort(indices[hits])
+            chords = np.linalg.norm(track[profiles] - stations[station],
+                                    axis=1)
+            overpasses += [(station,
+                            record.filename,
+                            profiles,
+                            float(great_circle_distance(chords.min())))]
+    return len(records), overpasses, failed
@@ -0,0 +1,214 @@
+"""
+Downsampled overviews of product fields.
+
+Overviews summarize a two-dimensional field, such as the radar
+reflectivity of a file, at several levels of resolution. Each level
+divides the field into blocks of profiles and range bins and stores the
+mean, the maximum and the fraction of valid values of each block. Every
+level combines blocks of 4 profiles and 2 range bins of the previous
+level.
+
+The overviews of a file are stored in a single :code:`.npz` file in the
+folder :code:`<directory>/<product>/<field>`, where directory is usually
+placed next to the index. The overview files are named after the full
+path of the product file, so that files with the same name in different
+folders don't share overviews.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from wxdata.readers.cache import file_fingerprint
+
+# Number of profiles and range bins of the previous level that are combined
+# into a block of the next level.
+FACTORS = (4, 2)
+
+def _as_2d(data):
+    """
+    Reshape field to an array of shape :code:`(profiles, bins)`.
+    """
+    data = np.ma.asanyarray(data)
+    return data.reshape(data.shape[0], -1)
+
+def _downsample(sums, counts, maxima, samples, factors):
+    """
+    Combine blocks of the given size.
+    """
+    n, m = sums.shape
+    fa = min(factors[0], n)
+    fh = min(factors[1], m)
+    pad = ((0, -n % fa), (0, -m % fh))
+
+    def reduce(x, fill, function):
+        x = np.pad(x, pad, constant_values=fill)
+        shape = (x.shape[0] // fa, fa, x.shape[1] // fh, fh)
+        return function(x.reshape(shape), axis=(1, 3))
+
+    return (reduce(sums, 0.0, np.sum),
+            reduce(counts, 0, np.sum),
+            reduce(maxima, -np.inf, np.max),
+            reduce(samples, 0, np.sum),
+            (fa, fh))
+
+def compute_overviews(data, levels=5):
+    """
+    Compute overviews of a field.
+
+    Arguments:
+        data(:code:`numpy.ndarray`): The field to compute the overviews of.
+            Profiles must run along the first axis. Trailing axes are
+            flattened. Masked and non-finite values are treated as missing.
+        levels(:code:`int`): The number of levels to compute.
+
+    Returns:
+        List containing for each level a dictionary with the block size
+        :code:`(profiles, bins)` and the arrays :code:`mean`, :code:`max`
+        and :code:`valid_fraction`.
+    """
+    data = _as_2d(data)
+    values = np.asarray(np.ma.getdata(data), dtype=np.float64)
+    valid = ~np.ma.getmaskarray(data) & np.isfinite(values)
+    sums = np.where(valid, values, 0.0)
+    maxima = np.where(valid, values, -np.inf)
+    counts = valid.astype(np.int64)
+    samples = np.ones(values.shape, dtype=np.int64)
+
+    overviews = []
+    block = (1, 1)
+    for _ in range(levels):
+        sums, counts, maxima, samples, factors = _downsample(
+            sums, counts, maxima, samples, FACTORS
+        )
+        block = (block[0] * factors[0], block[1] * factors[1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(counts > 0, sums / counts, np.nan)
+        overviews += [{"block": block,
+                       "mean": mean.astype(np.float32),
+                       "max": np.where(counts > 0, maxima, np.nan)
+                              .astype(np.float32),
+                       "valid_fraction": (counts / samples)
+                                         .astype(np.float32)}]
+    return overviews
+
+def overview_path(directory, product, field, filename):
+    """
+    Path of the overview file of a product file.
+
+    Arguments:
+        directory(:code:`str`): The folder containing the overviews.
+        product(:code:`str`): The name of the product.
+        field(:code:`str`): The name of the field.
+        filename(:code:`str`): The name of the product file.
+    """
+    key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+    name = "{}-{}.npz".format(os.path.basename(filename), key[:16])
+    return os.path.join(directory, product, field, name)
+
+def write_overviews(path, overviews, fingerprint=None):
+    """
+    Write overviews to file.
+
+    Arguments:
+        path(:code:`str`): The file to write.
+        overviews(:code:`list`): The overviews as returned by
+            :func:`compute_overviews`.
+        fingerprint: Tuple :code:`(size, mtime)` of the product file.
+    """
+    arrays = {"levels": np.array(len(overviews))}
+    if not fingerprint is None:
+        arrays["fingerprint"] = np.array(fingerprint, dtype=np.int64)
+    for i, level in enumerate(overviews):
+        for name, value in level.items():
+            arrays["{}_{}".format(name, i + 1)] = np.asarray(value)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp.npz"
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+def read_fingerprint(path):
+    """
+    Read fingerprint of the product file from an overview file.
+
+    Returns:
+        The fingerprint or None if the file doesn't exist or has no
+        fingerprint.
+    """
+    try:
+        with np.load(path) as f:
+            if not "fingerprint" in f:
+                return None
+            return tuple(int(x) for x in f["fingerprint"])
+    except (OSError, ValueError):
+        return None
+
+def read_overview(path, resolution=None):
+    """
+    Read coarsest overview satisfying a resolution.
+
+    Arguments:
+        path(:code:`str`): The overview file.
+        resolution: Tuple :code:`(profiles, bins)` with the largest block
+            size that is acceptable. If None, the coarsest level is read.
+
+    Returns:
+        Dictionary containing the block size and the arrays of the
+        coarsest level whose blocks are not larger than resolution or None
+        if even the finest level is too coarse.
+    """
+    with np.load(path) as f:
+        result = None
+        for i in range(1, int(f["levels"]) + 1):
+            block = tuple(int(x) for x in f["block_{}".format(i)])
+            if (not resolution is None and
+                    (block[0] > resolution[0] or block[1] > resolution[1])):
+                break
+            result = i
+        if result is None:
+            return None
+        return {"block": tuple(int(x) for x in f["block_{}".format(result)]),
+                "mean": f["mean_{}".format(result)],
+                "max": f["max_{}".format(result)],
+                "valid_fraction": f["valid_fraction_{}".format(result)]}
+
+def full_resolution(data):
+    """
+    Represent full-resolution field in the format of an overview.
+    """
+    data = _as_2d(data)
+    values = np.asarray(np.ma.getdata(data), dtype=np.float32)
+    valid = ~np.ma.getmaskarray(data) & np.isfinite(values)
+    values = np.where(valid, values, np.nan).astype(np.float32)
+    return {"block": (1, 1),
+            "mean": values,
+            "max": values,
+            "valid_fraction": valid.astype(np.float32)}
+
+def _generate_overviews(records, product, field, directory, levels):
+    """
+    Generate overviews for a list of files.
+
+    Files whose overviews are up to date are skipped.
+
+    Returns:
+        Tuple containing the number of processed files and a list of
+        tuples :code:`(filename, error)` for the files that could not be
+        processed.
+    """
+    failed = []
+    for record in records:
+        path = overview_path(directory, product, field, record.filename)
+        try:
+            fingerprint = file_fingerprint(record.filename)
+            if read_fingerprint(path) == fingerprint:
+                continue
+            file = record.open(cached=False)
+            try:
+                data = getattr(file, field)
+            finally:
+                file.close()
+            write_overviews(path, compute_overviews(data, levels), fingerprint)
+        except Exception as e:
+            failed += [(record.filename, "{}: {}".format(type(e).__name__, e))]
+    return len(records), failed
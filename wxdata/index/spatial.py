@@ -0,0 +1,307 @@
+"""
+Spatial lookup of indexed files.
+
+The footprint of a file is described by the bounding boxes of a small
+number of consecutive segments of its ground track. The footprints of
+all files of a product are stored in a :class:`BoxTree`, which is used
+to find the files that intersect a given region.
+
+Boxes are represented as arrays :code:`[lat_min, lat_max, lon_min,
+lon_max]`.
+"""
+import numpy as np
+
+################################################################################
+# Footprints
+################################################################################
+
+def footprint(latitude, longitude, n_segments=16):
+    """
+    Compute footprint of a ground track.
+
+    The track is split into segments of equal length and the bounding box
+    of each segment is computed. Segments that cross the date line are
+    represented by two boxes.
+
+    Arguments:
+        latitude(:code:`numpy.ndarray`): The latitudes of the track.
+        longitude(:code:`numpy.ndarray`): The longitudes of the track.
+        n_segments(:code:`int`): The number of segments to split the track
+            into.
+
+    Returns:
+        :code:`numpy.ndarray` of shape :code:`(n, 4)` containing the
+        bounding boxes of the segments.
+    """
+    latitude = np.asarray(latitude, dtype=np.float32).ravel()
+    longitude = np.asarray(longitude, dtype=np.float32).ravel()
+    boxes = []
+    for lats, lons in zip(np.array_split(latitude, n_segments),
+                          np.array_split(longitude, n_segments)):
+        if lats.size == 0:
+            continue
+        lat_min, lat_max = np.nanmin(lats), np.nanmax(lats)
+        lon_min, lon_max = np.nanmin(lons), np.nanmax(lons)
+        if lon_max - lon_min > 180.0:
+            east = lons[lons >= 0.0]
+            west = lons[lons < 0.0]
+            boxes += [[lat_min, lat_max, east.min(), 180.0],
+                      [lat_min, lat_max, -180.0, west.max()]]
+        else:
+            boxes += [[lat_min, lat_max, lon_min, lon_max]]
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+def product_footprint(product):
+    """
+    Compute footprint of a product file.
+
+    Arguments:
+        product: The opened product file.
+
+    Returns:
+        The footprint of the file as returned by :func:`footprint` or None
+        if the product has no latitude and longitude attributes.
+    """
+    if not (hasattr(type(product), "latitude") and
+            hasattr(type(product), "longitude")):
+        return None
+    return footprint(product.latitude, product.longitude)
+
+def _intersects(boxes, box):
+    """
+    Whether boxes intersect a given box.
+    """
+    return ((boxes[:, 0] <= box[1]) & (boxes[:, 1] >= box[0]) &
+            (boxes[:, 2] <= box[3]) & (boxes[:, 3] >= box[2]))
+
+################################################################################
+# Regions
+################################################################################
+
+class BoundingBox:
+    """
+    A latitude-longitude box.
+
+    Boxes with :code:`lon_min > lon_max` cross the date line.
+    """
+    def __init__(self, lon_min, lat_min, lon_max, lat_max):
+        """
+        Arguments:
+            lon_min(:code:`float`): Western boundary of the box.
+            lat_min(:code:`float`): Southern boundary of the box.
+            lon_max(:code:`float`): Eastern boundary of the box.
+            lat_max(:code:`float`): Northern boundary of the box.
+        """
+        self.lon_min = lon_min
+        self.lat_min = lat_min
+        self.lon_max = lon_max
+        self.lat_max = lat_max
+
+    def boxes(self):
+        """
+        The boxes to use to query a :class:`BoxTree` for this region.
+        """
+        if self.lon_min > self.lon_max:
+            return [np.array([self.lat_min, self.lat_max, self.lon_min, 180.0]),
+                    np.array([self.lat_min, self.lat_max, -180.0, self.lon_max])]
+        return [np.array([self.lat_min, self.lat_max,
+                          self.lon_min, self.lon_max])]
+
+    def contains(self, longitude, latitude):
+        """
+        Whether points lie within this region.
+
+        Arguments:
+            longitude(:code:`numpy.ndarray`): The longitudes of the points.
+            latitude(:code:`numpy.ndarray`): The latitudes of the points.
+
+        Returns:
+            Boolean array containing the result for each point.
+        """
+        longitude = np.asarray(longitude)
+        latitude = np.asarray(latitude)
+        result = np.zeros(longitude.shape, dtype=bool)
+        for lat_min, lat_max, lon_min, lon_max in self.boxes():
+            result |= ((latitude >= lat_min) & (latitude <= lat_max) &
+                       (longitude >= lon_min) & (longitude <= lon_max))
+        return result
+
+    def intersects(self, boxes):
+        """
+        Whether boxes intersect this region.
+
+        Arguments:
+            boxes(:code:`numpy.ndarray`): Array of shape :code:`(n, 4)`
+                containing the boxes to test.
+
+        Returns:
+            Boolean array containing the result for each box.
+        """
+        result = np.zeros(len(boxes), dtype=bool)
+        for box in self.boxes():
+            result |= _intersects(boxes, box)
+        return result
+
+class Polygon:
+    """
+    A polygon given by its vertices in longitude-latitude coordinates.
+
+    Polygons are treated as planar in longitude-latitude space and must
+    not cross the date line.
+    """
+    def __init__(self, vertices):
+        """
+        Arguments:
+            vertices: Sequence of :code:`(lon, lat)` pairs.
+        """
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+
+    def boxes(self):
+        """
+        The boxes to use to query a :class:`BoxTree` for this region.
+        """
+        lons, lats = self.vertices[:, 0], self.vertices[:, 1]
+        return [np.array([lats.min(), lats.max(), lons.min(), lons.max()])]
+
+    def contains(self, longitude, latitude):
+        """
+        Whether points lie within this region.
+
+        Arguments:
+            longitude(:code:`numpy.ndarray`): The longitudes of the points.
+            latitude(:code:`numpy.ndarray`): The latitudes of the points.
+
+        Returns:
+            Boolean array containing the result for each point.
+        """
+        longitude = np.asarray(longitude, dtype=np.float64)
+        latitude = np.asarray(latitude, dtype=np.float64)
+        points = np.stack([longitude.ravel(), latitude.ravel()], axis=1)
+        return self._contains(points).reshape(longitude.shape)
+
+    def _contains(self, points):
+        """
+        Ray-casting test for points given as :code:`(lon, lat)` pairs.
+        """
+        x, y = points[:, :1], points[:, 1:]
+        x0, y0 = self.vertices[:, 0], self.vertices[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        crosses = ((y0 > y) != (y1 > y)) & (x < x_cross)
+        return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+    def _crosses(self, p0, p1):
+        """
+        Whether any polygon edge crosses any of the segments p0-p1.
+        """
+        def orientation(a, b, c):
+            return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) -
+                           (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+        q0 = self.vertices[:, None, :]
+        q1 = np.roll(self.vertices, -1, axis=0)[:, None, :]
+        p0, p1 = p0[None, :, :], p1[None, :, :]
+        return np.any((orientation(p0, p1, q0) != orientation(p0, p1, q1)) &
+                      (orientation(q0, q1, p0) != orientation(q0, q1, p1)))
+
+    def intersects(self, boxes):
+        """
+        Whether boxes intersect this region.
+
+        Arguments:
+            boxes(:code:`numpy.ndarray`): Array of shape :code:`(n, 4)`
+                containing the boxes to test.
+
+        Returns:
+            Boolean array containing the result for each box.
+        """
+        result = np.zeros(len(boxes), dtype=bool)
+        for i, (lat_min, lat_max, lon_min, lon_max) in enumerate(boxes):
+            corners = np.array([[lon_min, lat_min], [lon_max, lat_min],
+                                [lon_max, lat_max], [lon_min, lat_max]])
+            inside = ((self.vertices[:, 0] >= lon_min) &
+                      (self.vertices[:, 0] <= lon_max) &
+                      (self.vertices[:, 1] >= lat_min) &
+                      (self.vertices[:, 1] <= lat_max))
+            result[i] = (inside.any() or
+                         self._contains(corners).any() or
+                         self._crosses(corners, np.roll(corners, -1, axis=0)))
+        return result
+
+def to_region(region):
+    """
+    Convert region argument to region object.
+
+    Arguments:
+        region: A :class:`BoundingBox` or :class:`Polygon` object or a
+            tuple :code:`(lon_min, lat_min, lon_max, lat_max)`.
+    """
+    if isinstance(region, (BoundingBox, Polygon)):
+        return region
+    return BoundingBox(*region)
+
+################################################################################
+# BoxTree
+################################################################################
+
+class BoxTree:
+    """
+    Static R-tree over a set of boxes.
+
+    The tree is bulk-loaded using sort-tile-recursive packing and stored
+    as one array of node boxes per level.
+    """
+    def __init__(self, boxes, ids, node_size=16):
+        """
+        Arguments:
+            boxes(:code:`numpy.ndarray`): Array of shape :code:`(n, 4)`
+                containing the boxes to store in the tree.
+            ids(:code:`numpy.ndarray`): Array of length :code:`n` containing
+                the identifiers of the boxes.
+            node_size(:code:`int`): The number of children of each node.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        ids = np.asarray(ids)
+        self.node_size = node_size
+
+        n = len(boxes)
+        n_leaves = -(-n // node_size)
+        n_slices = max(int(np.ceil(np.sqrt(n_leaves))), 1)
+        lat_c = boxes[:, 0] + boxes[:, 1]
+        lon_c = boxes[:, 2] + boxes[:, 3]
+        order = np.argsort(lon_c, kind="stable")
+        slices = np.arange(n) // (n_slices * node_size)
+        order = order[np.lexsort((lat_c[order], slices))]
+
+        self.ids = ids[order]
+        levels = [boxes[order]]
+        while len(levels[-1]) > node_size:
+            children = levels[-1]
+            starts = np.arange(0, len(children), node_size)
+            levels.append(np.stack([
+                np.minimum.reduceat(children[:, 0], starts),
+                np.maximum.reduceat(children[:, 1], starts),
+                np.minimum.reduceat(children[:, 2], starts),
+                np.maximum.reduceat(children[:, 3], starts)
+            ], axis=1))
+        self.levels = levels[::-1]
+
+    def query(self, box):
+        """
+        Find boxes intersecting a given box.
+
+        Arguments:
+            box: Array :code:`[lat_min, lat_max, lon_min, lon_max]` to
+                query.
+
+        Returns:
+            Sorted array of the unique identifiers of the intersecting boxes.
+        """
+        candidates = np.arange(len(self.levels[0]))
+        for i, level in enumerate(self.levels):
+            hits = candidates[_intersects(level[candidates], box)]
+            if i + 1 == len(self.levels):
+                return np.unique(self.ids[hits])
+            candidates = (hits[:, None] * self.node_size +
+                          np.arange(self.node_size)).ravel()
+            candidates = candidates[candidates < len(self.levels[i + 1])]
@@ -0,0 +1,272 @@
+"""
+SQLite storage backend for file indices.
+
+The records of an index are stored in a single table, which is indexed
+by product and start time. This allows time range queries to be answered
+directly from the file without loading the index into memory.
+"""
+import os
+import pickle
+import sqlite3
+from datetime import datetime, timedelta
+from urllib.request import pathname2url
+
+import numpy as np
+
+# First bytes of every SQLite database file.
+_MAGIC = b"SQLite format 3\x00"
+
+# Reference time for the integer timestamps stored in the database.
+_EPOCH = datetime(1970, 1, 1)
+
+_SCHEMA = """
+CREATE TABLE products (
+    name TEXT PRIMARY KEY,
+    n_files INTEGER NOT NULL,
+    max_duration INTEGER NOT NULL
+);
+CREATE TABLE files (
+    product TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    start_time INTEGER,
+    end_time INTEGER,
+    size INTEGER,
+    mtime INTEGER,
+    footprint BLOB
+);
+CREATE INDEX files_product_start_time ON files (product, start_time);
+"""
+
+def _to_int(time):
+    """
+    Convert datetime to microseconds since epoch.
+    """
+    if time is None:
+        return None
+    dt = time - _EPOCH
+    return (dt.days * 86400 + dt.seconds) * 1000000 + dt.microseconds
+
+def _to_datetime(time):
+    """
+    Convert microseconds since epoch to datetime.
+    """
+    if time is None:
+        return None
+    return _EPOCH + timedelta(microseconds=time)
+
+def is_sqlite(filename):
+    """
+    Determine whether a file is an SQLite database.
+
+    Arguments:
+        filename(:code:`str`): The file to check.
+    """
+    with open(filename, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+class SqliteStorage:
+    """
+    Read-only view of an index stored in an SQLite database.
+
+    Filenames are stored relative to the folder containing the database
+    and converted to absolute paths when records are read.
+
+    Attributes:
+        filename(:code:`str`): Path of the database file.
+        products(:code:`dict`): Dictionary mapping the names of the products
+            in the index to the number of files of each product.
+    """
+    def __init__(self, filename):
+        """
+        Open database.
+
+        Arguments:
+            filename(:code:`str`): Path of the database file.
+        """
+        self.filename = os.path.abspath(filename)
+        self.directory = os.path.dirname(self.filename)
+        uri = "file:{}?mode=ro".format(pathname2url(self.filename))
+        self.connection = sqlite3.connect(uri,
+                                          uri=True,
+                                          check_same_thread=False)
+        rows = self.connection.execute(
+            "SELECT name, n_files, max_duration FROM products"
+        ).fetchall()
+        self.products = {name: n for name, n, _ in rows}
+        self._max_durations = {name: d for name, _, d in rows}
+
+    def _rows(self, cursor):
+        for filename, start_time, end_time, size, mtime, footprint in cursor:
+            fingerprint = None
+            if not size is None:
+                fingerprint = (size, mtime)
+            if not footprint is None:
+                footprint = np.frombuffer(footprint,
+                                          dtype=np.float32).reshape(-1, 4)
+            yield (os.path.join(self.directory, filename),
+                   _to_datetime(start_time),
+                   _to_datetime(end_time),
+                   fingerprint,
+                   footprint)
+
+    def read(self, product):
+        """
+        Read all records of a product.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+
+        Returns:
+            List of tuples :code:`(filename, start_time, end_time,
+            fingerprint, footprint)` sorted by start time.
+        """
+        cursor = self.connection.execute(
+            "SELECT filename, start_time, end_time, size, mtime, footprint "
+            "FROM files "
+            "WHERE product = ? ORDER BY start_time, rowid",
+            (product,)
+        )
+        return list(self._rows(cursor))
+
+    def query(self, product, start=None, end=None):
+        """
+        Read records of a product within a given time range.
+
+        Since no file lasts longer than the longest file of the product,
+        the query can be restricted to files with start times within
+        this duration from the start of the time range. Records whose
+        end time hasn't been resolved are always included in the result
+        if their start time doesn't exclude them.
+
+        Arguments:
+            product(:code:`str`): Name of the product.
+            start(:code:`datetime`): If given, only records with an end
+                time later than or equal to start are returned.
+            end(:code:`datetime`): If given, only records with a start
+                time earlier than end are returned.
+
+        Returns:
+            List of tuples :code:`(filename, start_time, end_time,
+            fingerprint, footprint)` sorted by start time.
+        """
+        conditions = ["product = ?"]
+        arguments = [product]
+        if not start is None:
+            start = _to_int(start)
+            conditions += ["start_time >= ?",
+                           "(end_time >= ? OR end_time IS NULL)"]
+            arguments += [start - self._max_durations[product], start]
+        if not end is None:
+            conditions += ["start_time < ?"]
+            arguments += [_to_int(end)]
+        cursor = self.connection.execute(
+            "SELECT filename, start_time, end_time, size, mtime, footprint "
+            "FROM files "
+            "WHERE " + " AND ".join(conditions) +
+            " ORDER BY start_time, rowid",
+            arguments
+        )
+        return list(self._rows(cursor))
+
+    def close(self):
+        """
+        Close database connection.
+        """
+        self.connection.close()
+
+    @staticmethod
+    def write(filename, files):
+        """
+        Write records to database.
+
+        The database is written to a temporary file first, which then
+        replaces any existing file at the given path.
+
+        Arguments:
+            filename(:code:`str`): Path of the database file to write.
+            files(:code:`dict`): Dictionary mapping product names to
+                lists of :class:`FileRecord` objects.
+        """
+        filename = os.path.abspath(filename)
+        directory = os.path.dirname(filename)
+        temporary = filename + ".tmp"
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+        def rows(product, records):
+            for f in records:
+                size, mtime = getattr(f, "fingerprint", None) or (None, None)
+                end_time = f.end_time if f.end_time_resolved else None
+                footprint = getattr(f, "footprint", None)
+                if not footprint is None:
+                    footprint = np.asarray(footprint, dtype=np.float32)
+                    footprint = footprint.tobytes()
+                yield (product,
+                       os.path.relpath(f.filename, start=directory),
+                       _to_int(f.start_time),
+                       _to_int(end_time),
+                       size,
+                       mtime,
+                       footprint)
+
+        connection = sqlite3.connect(temporary)
+        try:
+            with connection:
+                connection.executescript(_SCHEMA)
+                for product, records in files.items():
+                    max_duration = max(
+                        [_to_int(f.max_end_time) - _to_int(f.start_time)
+                         for f in records
+                         if not (f.start_time is None or
+                                 f.max_end_time is None)],
+                        default=0
+                    )
+                    connection.execute(
+                        "INSERT INTO products VALUES (?, ?, ?)",
+                        (product, len(records), max_duration)
+                    )
+                    connection.executemany(
+                        "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows(product, records)
+                    )
+        finally:
+            connection.close()
+        os.replace(temporary, filename)
+
+def load_pickle(filename):
+    """
+    Load index stored in the legacy pickle format.
+
+    Arguments:
+        filename(:code:`str`): The pickled index to load.
+
+    Returns:
+        The loaded :class:`wxdata.index.Index` object with absolute
+        filenames.
+    """
+    filename = os.path.expanduser(filename)
+    directory = os.path.abspath(os.path.dirname(filename))
+    with open(filename, "rb") as f:
+        index = pickle.load(f)
+
+    index._time_indices = {}
+    index._spatial_indices = {}
+    index._storage = None
+    index._resolved = []
+    for k in index._files:
+        for f in index._files[k]:
+            f.make_absolute(directory)
+        index._sort(k)
+    return index
+
+def convert(source, destination):
+    """
+    Convert pickled index to SQLite format.
+
+    Arguments:
+        source(:code:`str`): The pickled index to convert.
+        destination(:code:`str`): Path of the SQLite database to write.
+            May be the same as source.
+    """
+    index = load_pickle(source)
+    index.store(destination)
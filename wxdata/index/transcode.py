@@ -0,0 +1,327 @@
+"""
+Memory-mapped cache of transcoded product files.
+
+Reading fields from HDF4 files is slow and can't be done from several
+threads at once. The :class:`TranscodeCache` decodes the fields of a
+product file once and stores each of them as a :code:`.npy` file in a
+cache directory. Later reads of the file load the fields with
+:code:`numpy.load(mmap_mode="r")`, so that they can be shared without
+copying between any number of processes.
+
+Each file is stored in its own sub-directory, which also contains a
+:code:`metadata.json` file describing the fields and the size and
+modification time of the source file. Entries whose source file has
+changed are discarded and transcoded again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from wxdata.products.common import product_fields
+from wxdata.index.storage import _to_datetime, _to_int
+from wxdata.readers.cache import file_fingerprint, remove_directory
+
+def _entry_size(path):
+    """
+    Total size of the files of a cache entry.
+    """
+    size = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False):
+            size += entry.stat().st_size
+    return size
+
+class TranscodedFile:
+    """
+    Product file whose fields are read from a :class:`TranscodeCache`.
+
+    The fields of the file are available as attributes holding read-only
+    memory-mapped arrays. All fields are mapped when the object is created,
+    so that they remain valid if the entry is evicted afterwards. All other
+    attributes are looked up on the source product, which is opened on
+    first access.
+
+    Attributes:
+        filename(:code:`str`): The path of the source file.
+        directory(:code:`str`): The cache entry containing the fields.
+        product(:code:`str`): The name of the product class.
+        fields(:code:`list`): The names of the transcoded fields.
+        start_time(:code:`datetime`): Start time of the source file.
+        end_time(:code:`datetime`): End time of the source file.
+    """
+    def __init__(self, directory, metadata, open_source):
+        """
+        Arguments:
+            directory(:code:`str`): The cache entry containing the fields.
+            metadata(:code:`dict`): The metadata of the entry.
+            open_source: Function without arguments that opens the source
+                product file.
+        """
+        self.filename = metadata["filename"]
+        self.directory = directory
+        self.product = metadata["product"]
+        self.fields = list(metadata["fields"])
+        self.start_time = _to_datetime(metadata["start_time"])
+        self.end_time = _to_datetime(metadata["end_time"])
+        self._metadata = metadata
+        self._open_source = open_source
+        self._source = None
+        self._closed = False
+        for name in self.fields:
+            self.__dict__[name] = self._load(name)
+
+    def _load(self, name):
+        """
+        Map field into memory.
+        """
+        path = os.path.join(self.directory, name)
+        data = np.load(path + ".npy", mmap_mode="r")
+        if self._metadata["fields"][name]["masked"]:
+            mask = np.load(path + ".mask.npy", mmap_mode="r")
+            return np.ma.masked_array(data, mask=mask, copy=False)
+        return data
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._source is None:
+            self._source = self._open_source()
+        return getattr(self._source, name)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """
+        Close the source product if it was opened. Fields that were already
+        accessed remain valid.
+        """
+        if not self._source is None:
+            self._source.close()
+            self._source = None
+        self._closed = True
+
+    def __repr__(self):
+        return "Transcoded " + self.product + " file: " + self.filename
+
+class TranscodeCache:
+    """
+    Size-capped directory of transcoded product files.
+
+    The cache is disabled as long as no directory is set. When the total
+    size of the cache exceeds :code:`max_bytes`, the least recently used
+    entries are removed. Entries are written to a temporary directory and
+    renamed into place, so several processes may use the same cache
+    directory.
+
+    Attributes:
+        directory(:code:`str`): The cache directory or None.
+        max_bytes(:code:`int`): The maximum total size of the cache.
+        hits(:code:`int`): The number of lookups that found a transcoded
+            file.
+        misses(:code:`int`): The number of lookups that had to transcode
+            the file.
+        evictions(:code:`int`): The number of entries that were removed.
+        retries(:code:`int`): The number of times a file is transcoded
+            again if its entry can't be read after transcoding it.
+    """
+    def __init__(self, directory=None, max_bytes=2 ** 32, retries=2):
+        """
+        Arguments:
+            directory(:code:`str`): The cache directory or None.
+            max_bytes(:code:`int`): The maximum total size of the cache.
+            retries(:code:`int`): The number of times a file is transcoded
+                again if its entry can't be read after transcoding it.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return not self.directory is None
+
+    @property
+    def stats(self):
+        """
+        Dictionary containing the cache statistics.
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
+
+    def _entry(self, filename, product):
+        key = "{}:{}".format(product, filename).encode()
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest())
+
+    def _read_metadata(self, entry, fingerprint):
+        """
+        Read metadata of entry if it is valid for the given fingerprint.
+        """
+        try:
+            with open(os.path.join(entry, "metadata.json")) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("fingerprint") != fingerprint:
+            return None
+        return metadata
+
+    def get(self, filename, product, open):
+        """
+        Get transcoded file from cache.
+
+        Arguments:
+            filename(:code:`str`): The path of the source file.
+            product(:code:`str`): The name of the product class.
+            open: Function without arguments that opens the source product
+                file.
+
+        Returns:
+            :class:`TranscodedFile` object providing the fields of the file.
+        """
+        filename = os.path.abspath(filename)
+        # Fingerprints are stored as JSON lists.
+        fingerprint = list(file_fingerprint(filename))
+        entry = self._entry(filename, product)
+
+        metadata = self._read_metadata(entry, fingerprint)
+        if not metadata is None:
+            try:
+                os.utime(os.path.join(entry, "metadata.json"))
+                result = TranscodedFile(entry, metadata, open)
+            except OSError:
+                # The entry was evicted by another process before its
+                # fields were mapped.
+                result = None
+            if not result is None:
+                with self._lock:
+                    self.hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        for attempt in range(self.retries + 1):
+            if os.path.exists(entry):
+                remove_directory(entry, ignore_errors=True)
+            metadata = self._transcode(filename, product, fingerprint, entry,
+                                       open)
+            self._evict(keep=entry)
+            try:
+                return TranscodedFile(entry, metadata, open)
+            except OSError:
+                # The entry was evicted by another process before its
+                # fields were mapped.
+                if attempt == self.retries:
+                    raise
+
+    def _transcode(self, filename, product, fingerprint, entry, open_source):
+        """
+        Decode fields of file and write them to the cache.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        source = open_source()
+        try:
+            fields = {}
+            for name in product_fields(type(source)):
+                # Fields that can't be read from this file are left to the
+                # source product.
+                try:
+                    value = getattr(source, name)
+                except Exception:
+                    continue
+                value = np.ma.asanyarray(value)
+                if value.dtype == object:
+                    continue
+                path = os.path.join(temporary, name)
+                np.save(path + ".npy", np.ma.getdata(value))
+                masked = not np.ma.getmask(value) is np.ma.nomask
+                if masked:
+                    np.save(path + ".mask.npy", np.ma.getmaskarray(value))
+                fields[name] = {"masked": masked,
+                                "dtype": value.dtype.str,
+                                "shape": list(value.shape)}
+            times = {}
+            for name in ["start_time", "end_time"]:
+                times[name] = _to_int(getattr(source, name, None))
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        finally:
+            source.close()
+
+        metadata = {"filename": filename,
+                    "product": product,
+                    "fingerprint": fingerprint,
+                    "fields": fields}
+        metadata.update(times)
+        with open(os.path.join(temporary, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+        os.chmod(temporary, 0o755)
+
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            # Another process transcoded the file concurrently.
+            shutil.rmtree(temporary, ignore_errors=True)
+            existing = self._read_metadata(entry, fingerprint)
+            if existing is None:
+                raise
+            metadata = existing
+        return metadata
+
+    def _evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits into
+        :code:`max_bytes`.
+
+        Arguments:
+            keep(:code:`str`): Entry that must not be removed.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path,
+                                            "metadata.json")).st_mtime
+                size = _entry_size(entry.path)
+            except OSError:
+                continue
+            entries.append((used, size, entry.path))
+            total += size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            remove_directory(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        if self.directory is None or not os.path.exists(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.startswith("."):
+                remove_directory(entry.path, ignore_errors=True)
+
+# Cache used by :meth:`wxdata.index.FileRecord.open`.
+transcode_cache = TranscodeCache()
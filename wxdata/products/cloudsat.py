@@ -1,9 +1,9 @@
 import re
 import os
 import numpy as np
-import numpy.ma as ma
 from datetime import datetime, timedelta
-from wxdata.products.common import Hdf4File
+from wxdata.products.common import Hdf4File, cached_field
+from wxdata.products.decoding import decode, ScaledArray
 
 ################################################################################
 # CloudSatBase
@@ -13,14 +13,20 @@ class CloudSatBase(Hdf4File):
     """
     Base class for CloudSat files.
     """
+    # Upper bound for the time covered by a granule. Each granule covers a
+    # single orbit of about 99 minutes.
+    granule_duration = timedelta(minutes=100)
+
     @staticmethod
     def name_to_date(name):
         name = os.path.basename(name)
         name = name.split("_")[0]
         return datetime.strptime(name, "%Y%j%H%M%S")
 
-    def __init__(sefl, filename):
+    def __init__(self, filename):
         super().__init__(filename)
+        self._date = None
+        self._utc_start = None
 
     @property
     def start_time(self):
@@ -28,10 +34,7 @@ class CloudSatBase(Hdf4File):
         datetime object corresponding to the timestamp of the first profile
         in the file.
         """
-        utc_start = self.vs.attach("UTC_start")[0]
-        start_time = self.date + timedelta(seconds=utc_start[0])
-        return start_time
-
+        return self.date + timedelta(seconds=self.utc_start)
 
     @property
     def end_time(self):
@@ -39,9 +42,9 @@ class CloudSatBase(Hdf4File):
         datetime object corresponding to the timestamp of the last profile
         in the file.
         """
-        start_time = self.start_time
-        dt = timedelta(seconds=self["Profile_time"][-1][0])
-        return start_time + dt
+        # Indexing the vdata with a single index reads only this record.
+        dt = timedelta(seconds=float(self["Profile_time"][-1][0]))
+        return self.start_time + dt
 
     @property
     def date(self):
@@ -49,21 +52,147 @@ class CloudSatBase(Hdf4File):
         datetime object corresponding to 00:00:00 on the day of the first
         profile in the file.
         """
-        date = self.__class__.pattern.match(os.path.basename(self.filename)).group(1)
-        date = datetime.strptime(date, "%Y%j%H%M%S")
-        return datetime(year=date.year, month=date.month, day=date.day)
+        if self._date is None:
+            name = os.path.basename(self.filename)
+            date = self.__class__.pattern.match(name).group(1)
+            date = datetime.strptime(date, "%Y%j%H%M%S")
+            self._date = datetime(year=date.year,
+                                  month=date.month,
+                                  day=date.day)
+        return self._date
 
     @property
-    def latitude(self):
-        return np.array(self["Latitude"][:], dtype=np.float32)
+    def utc_start(self):
+        """
+        Time of the first profile in the file in seconds since
+        :attr:`date`.
+        """
+        if self._utc_start is None:
+            self._utc_start = float(self["UTC_start"][0][0])
+        return self._utc_start
+
+    @cached_field
+    def profile_times(self):
+        """
+        Timestamps of the profiles as :code:`numpy.datetime64[ms]` array.
+        """
+        seconds = np.asarray(self._read("Profile_time"), dtype=np.float64)
+        milliseconds = np.rint((seconds.ravel() + self.utc_start) * 1e3)
+        return (np.datetime64(self.date, "ms") +
+                milliseconds.astype(np.int64).astype("timedelta64[ms]"))
 
     @property
-    def longitude(self):
-        return np.array(self["Longitude"][:], dtype=np.float32)
+    def n_profiles(self):
+        """
+        The number of profiles in the file.
+        """
+        return self["Profile_time"].inquire()[0]
 
     @property
+    def profiles(self):
+        """
+        Indexer to select profiles by slicing, e.g.
+        :code:`granule.profiles[i0:i1].radar_reflectivity`.
+        """
+        return _ProfileIndexer(self)
+
+    def select(self, profiles=None, time=None, region=None):
+        """
+        Select a range of profiles.
+
+        Creates a view of the granule, whose fields contain only the
+        selected profiles. Only the selected profiles are read from the
+        file. Selections can be combined and are applied one after the
+        other. Views can be selected from again.
+
+        Arguments:
+            profiles: Tuple :code:`(start, stop)` or slice with the indices
+                of the profiles to select. Negative indices count from the
+                end as for slices.
+            time: Tuple :code:`(start, end)` of datetime objects. Selects
+                the profiles with timestamps from start up to, but not
+                including, end. Either bound may be None to leave that side
+                of the range open.
+            region: A :class:`wxdata.index.spatial.BoundingBox` or
+                :class:`wxdata.index.spatial.Polygon` object or a tuple
+                :code:`(lon_min, lat_min, lon_max, lat_max)`. Selects the
+                range of profiles from the first to the last profile
+                within the region.
+
+        Returns:
+            A view of the granule restricted to the selected profiles.
+        """
+        n = self.n_profiles
+        view = self
+        if not profiles is None:
+            if isinstance(profiles, slice):
+                if not profiles.step in [None, 1]:
+                    raise ValueError("Profile selections must be contiguous.")
+            else:
+                profiles = slice(*profiles)
+            start, stop, _ = profiles.indices(view._length(n))
+            view = view.window(start, stop, n)
+        if not time is None:
+            t0, t1 = time
+            seconds = view._read("Profile_time").ravel() + self.utc_start
+            i0, i1 = 0, seconds.size
+            if not t0 is None:
+                t0 = (t0 - self.date).total_seconds()
+                i0 = np.searchsorted(seconds, t0, side="left")
+            if not t1 is None:
+                t1 = (t1 - self.date).total_seconds()
+                i1 = np.searchsorted(seconds, t1, side="left")
+            view = view.window(i0, i1, n)
+        if not region is None:
+            from wxdata.index.spatial import to_region
+            inside = to_region(region).contains(view.longitude.ravel(),
+                                                view.latitude.ravel())
+            indices = np.where(inside)[0]
+            if indices.size == 0:
+                raise ValueError("The selection does not contain any "
+                                 "profiles.")
+            view = view.window(indices[0], indices[-1] + 1, n)
+        return view
+
+    def _length(self, n_profiles):
+        """
+        The number of profiles in this file or view.
+        """
+        if self._window is None:
+            return n_profiles
+        return self._window[1] - self._window[0]
+
+    @cached_field
+    def latitude(self):
+        return np.array(self._read("Latitude"), dtype=np.float32)
+
+    @cached_field
+    def longitude(self):
+        return np.array(self._read("Longitude"), dtype=np.float32)
+
+    @cached_field
     def altitude(self):
-        return np.array(self["Height"][:], dtype=np.float32)
+        return np.array(self._read("Height"), dtype=np.float32)
+
+class _ProfileIndexer:
+    """
+    Helper class implementing :attr:`CloudSatBase.profiles`.
+    """
+    def __init__(self, granule):
+        self.granule = granule
+
+    def __getitem__(self, profiles):
+        if not isinstance(profiles, slice):
+            granule = self.granule
+            n = granule._length(granule.n_profiles)
+            i = int(profiles)
+            if i < 0:
+                i += n
+            if i < 0 or i >= n:
+                raise IndexError("Profile index {} is out of range."
+                                 .format(profiles))
+            profiles = slice(i, i + 1)
+        return self.granule.select(profiles=profiles)
 
 ################################################################################
 # Level 1b
@@ -104,7 +233,7 @@ class CloudSat_2b_GeoProf(CloudSatBase):
         """
         super().__init__(filename)
 
-    @property
+    @cached_field
     def radar_reflectivity(self):
         """
         Scaled and masked radar reflectivities.
@@ -115,23 +244,47 @@ class CloudSat_2b_GeoProf(CloudSatBase):
 
         In addition to this, values outside the range given in [1]_ are masked.
         """
-        raw_data = self["Radar_Reflectivity"][:]
-        data = np.array(raw_data, dtype=np.float32) / 100.0
-        mask = raw_data <= -8888
-        data = np.maximum(data, -40)
-        data = np.minimum(data, 50)
-        return ma.masked_array(data, mask=mask)
+        return self.get_radar_reflectivity()
 
-    @property
+    def get_radar_reflectivity(self, out=None, mask_out=None, compact=False):
+        """
+        Decode radar reflectivities. See :attr:`radar_reflectivity`.
+
+        Arguments:
+            out(:code:`numpy.ndarray`): float32 array to decode the data into.
+            mask_out(:code:`numpy.ndarray`): Boolean array to write the mask
+                to.
+            compact(:code:`bool`): If true, a
+                :class:`wxdata.products.decoding.ScaledArray` holding the raw
+                int16 data is returned instead.
+        """
+        raw_data = self._read("Radar_Reflectivity")
+        parameters = {"factor": 100.0,
+                      "fill_max": -8888,
+                      "valid_range": (-40, 50)}
+        if compact:
+            return ScaledArray(raw_data, **parameters)
+        return decode(raw_data, out=out, mask_out=mask_out, **parameters)
+
+    @cached_field
     def cloud_mask(self):
-        raw_data = self["CPR_Cloud_mask"][:]
-        mask = raw_data == -9
-        data = np.array(raw_data, dtype=np.float32)
-        return ma.masked_array(data, mask=mask)
+        return self.get_cloud_mask()
 
-    @property
+    def get_cloud_mask(self, out=None, mask_out=None):
+        """
+        Decode cloud mask. See :attr:`cloud_mask`.
+
+        Arguments:
+            out(:code:`numpy.ndarray`): float32 array to decode the data into.
+            mask_out(:code:`numpy.ndarray`): Boolean array to write the mask
+                to.
+        """
+        raw_data = self._read("CPR_Cloud_mask")
+        return decode(raw_data, fill_value=-9, out=out, mask_out=mask_out)
+
+    @cached_field
     def DEM_elevation(self):
-        return np.array(self["DEM_elevation"][:], dtype=np.float32)
+        return np.array(self._read("DEM_elevation"), dtype=np.float32)
 
 class CloudSat_Modis_Aux(CloudSatBase):
 
@@ -146,7 +299,7 @@ class CloudSat_Modis_Aux(CloudSatBase):
         """
         super().__init__(filename)
 
-    @property
+    @cached_field
     def emissivity_channels(self):
         """
         Scaled emissivity.
@@ -154,37 +307,102 @@ class CloudSat_Modis_Aux(CloudSatBase):
         This property contains the corrected emissivities of the
         MODIS long wave channels.
         """
-        raw_data = np.float32(self["EV_1KM_Emissive"][:])
-        mask = self["EV_1KM_Emissive"][:] >= 32768
-        for i in range(raw_data.shape[-1]):
-            granule_indices = self["MODIS_granule_index"][:, i]
-            mask[:, :, i] += granule_indices == -99
-            if min(granule_indices)<0:
-                offsets = -999
-                scales = -999
-            else:
-                offsets = self["EV_1KM_Emissive_rad_offsets"][:][:, granule_indices]
-                scales = self["EV_1KM_Emissive_rad_scales"][:][:, granule_indices]
-            mask[:, :, i] += offsets == -999
-            mask[:, :, i] += scales == -999
-            raw_data[:, :, i] -= offsets
-            raw_data[:, :, i] *= scales
-        return np.ma.masked_array(raw_data, mask=mask)
-    @property
+        return self.get_emissivity_channels()
+
+    def get_emissivity_channels(self, channels=None):
+        """
+        Scaled emissivity of selected channels.
+
+        The raw data of all profiles is scaled at once by looking up the
+        scale and offset of the MODIS granule of each pixel. Pixels of
+        profiles with a missing granule index are masked.
+
+        Arguments:
+            channels: Indices of the channels to return. If not given,
+                all channels are returned.
+
+        Returns:
+            Masked array containing the emissivities of the requested
+            channels along its first axis.
+        """
+        offsets = self._read("EV_1KM_Emissive_rad_offsets")
+        scales = self._read("EV_1KM_Emissive_rad_scales")
+        if channels is None:
+            raw_data = self._read("EV_1KM_Emissive")
+        else:
+            channels = np.atleast_1d(channels)
+            raw_data = np.stack([self._read("EV_1KM_Emissive", index=int(c))
+                                 for c in channels])
+            offsets = offsets[channels]
+            scales = scales[channels]
+
+        granule_indices = self._read("MODIS_granule_index")
+        invalid = granule_indices < 0
+        offsets = offsets[:, np.where(invalid, 0, granule_indices)]
+        scales = scales[:, np.where(invalid, 0, granule_indices)]
+        invalid_profiles = np.any(invalid, axis=0)
+        offsets[:, :, invalid_profiles] = -999
+        scales[:, :, invalid_profiles] = -999
+
+        mask = raw_data >= 32768
+        mask |= granule_indices == -99
+        mask |= offsets == -999
+        mask |= scales == -999
+
+        data = raw_data.astype(np.float32)
+        data -= offsets
+        data *= scales
+        return np.ma.masked_array(data, mask=mask)
+
+    @cached_field
     def modis_latitude(self):
-        raw_data = (self["MODIS_latitude"][:])
-        mask = raw_data == -999
-        data = np.array(raw_data, dtype=np.float32)
-        return ma.masked_array(data, mask=mask)
-    @property
+        return self.get_modis_latitude()
+
+    def get_modis_latitude(self, out=None, mask_out=None):
+        """
+        Decode MODIS latitudes. See :attr:`modis_latitude`.
+
+        Arguments:
+            out(:code:`numpy.ndarray`): float32 array to decode the data into.
+            mask_out(:code:`numpy.ndarray`): Boolean array to write the mask
+                to.
+        """
+        raw_data = self._read("MODIS_latitude")
+        return decode(raw_data, fill_value=-999, out=out, mask_out=mask_out)
+
+    @cached_field
     def modis_longitude(self):
-        raw_data = (self["MODIS_longitude"][:])
-        mask = raw_data == -999
-        data = np.array(raw_data, dtype=np.float32)
-        return ma.masked_array(data, mask=mask)
-    @property
+        return self.get_modis_longitude()
+
+    def get_modis_longitude(self, out=None, mask_out=None):
+        """
+        Decode MODIS longitudes. See :attr:`modis_longitude`.
+
+        Arguments:
+            out(:code:`numpy.ndarray`): float32 array to decode the data into.
+            mask_out(:code:`numpy.ndarray`): Boolean array to write the mask
+                to.
+        """
+        raw_data = self._read("MODIS_longitude")
+        return decode(raw_data, fill_value=-999, out=out, mask_out=mask_out)
+
+    @cached_field
     def modis_azimuth_angle(self):
-        raw_data = (self["Sensor_azimuth"][:])
-        mask = raw_data == -32767
-        data = np.array(raw_data, dtype=np.float32)
-        return ma.masked_array(data, mask=mask)
+        return self.get_modis_azimuth_angle()
+
+    def get_modis_azimuth_angle(self, out=None, mask_out=None, compact=False):
+        """
+        Decode MODIS sensor azimuth angles. See :attr:`modis_azimuth_angle`.
+
+        Arguments:
+            out(:code:`numpy.ndarray`): float32 array to decode the data into.
+            mask_out(:code:`numpy.ndarray`): Boolean array to write the mask
+                to.
+            compact(:code:`bool`): If true, a
+                :class:`wxdata.products.decoding.ScaledArray` holding the raw
+                data is returned instead.
+        """
+        raw_data = self._read("Sensor_azimuth")
+        if compact:
+            return ScaledArray(raw_data, fill_value=-32767)
+        return decode(raw_data, fill_value=-32767, out=out, mask_out=mask_out)
@@ -1,4 +1,165 @@
+import os
+import threading
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from copy import copy
+from functools import wraps
+
+import numpy as np
+
+################################################################################
+# Decoded-field cache
+################################################################################
+
+def _nbytes(value):
+    """
+    Memory used by a decoded field.
+    """
+    if isinstance(value, np.ma.MaskedArray):
+        return value.data.nbytes + np.ma.getmask(value).nbytes
+    return getattr(value, "nbytes", 0)
+
+class FieldCache:
+    """
+    Thread-safe LRU cache of decoded product fields.
+
+    Fields are identified by the file they were read from, so the cache
+    is shared by all product objects opened from the same file. The
+    fields of a file are removed from the cache when the file is closed.
+    The cache is disabled as long as :code:`max_bytes` is 0.
+
+    Fields obtained from the cache are shared and must not be modified
+    in place.
+
+    Attributes:
+        max_bytes(:code:`int`): Memory budget for all cached fields.
+        hits(:code:`int`): The number of lookups that found a cached field.
+        misses(:code:`int`): The number of lookups that had to decode the
+            field.
+        evictions(:code:`int`): The number of fields that were evicted.
+    """
+    def __init__(self, max_bytes=0):
+        """
+        Arguments:
+            max_bytes(:code:`int`): Memory budget for all cached fields.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._fields = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @property
+    def stats(self):
+        """
+        Dictionary containing the cache statistics.
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "fields": len(self._fields),
+                    "bytes": self._bytes}
+
+    def get(self, key, decode):
+        """
+        Get decoded field from cache.
+
+        Arguments:
+            key: Tuple identifying the field. The first element must be
+                the name of the file the field is read from.
+            decode: Function without arguments that decodes the field if
+                it is not in the cache.
+        """
+        with self._lock:
+            if key in self._fields:
+                self._fields.move_to_end(key)
+                self.hits += 1
+                return self._fields[key][0]
+            self.misses += 1
+
+        value = decode()
+        size = _nbytes(value)
+        with self._lock:
+            if size > self.max_bytes or key in self._fields:
+                return value
+            self._fields[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._fields.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def invalidate(self, filename):
+        """
+        Remove all fields of a file from the cache.
+
+        Arguments:
+            filename(:code:`str`): The name of the file.
+        """
+        with self._lock:
+            for key in [k for k in self._fields if k[0] == filename]:
+                _, size = self._fields.pop(key)
+                self._bytes -= size
+
+    def clear(self):
+        """
+        Remove all fields from the cache.
+        """
+        with self._lock:
+            self._fields.clear()
+            self._bytes = 0
+
+# Cache used by product properties defined with :func:`cached_field`.
+field_cache = FieldCache()
+
+def cached_field(method):
+    """
+    Define a property whose value is stored in :data:`field_cache`.
+
+    Arguments:
+        method: The method decoding the field.
+    """
+    @wraps(method)
+    def get(self):
+        if not field_cache.enabled:
+            return method(self)
+        key = (os.path.abspath(self.filename),
+               type(self).__name__,
+               method.__name__,
+               self._window)
+        return field_cache.get(key, lambda: method(self))
+    get.is_field = True
+    return property(get)
+
+def product_fields(product_class):
+    """
+    Names of the fields of a product class.
+
+    Arguments:
+        product_class: The product class.
+
+    Returns:
+        Sorted list of the names of the properties of the class that were
+        defined with :func:`cached_field`.
+    """
+    fields = []
+    for name in dir(product_class):
+        attribute = getattr(product_class, name, None)
+        if getattr(getattr(attribute, "fget", None), "is_field", False):
+            fields.append(name)
+    return fields
+
+################################################################################
+# Products
+################################################################################
 
 class DataProductBase(metaclass=ABCMeta):
 
@@ -13,12 +174,32 @@ class DataProductBase(metaclass=ABCMeta):
     def artifact(self, artifact):
         self._artifact = artifact
 
+    def close(self):
+        """
+        Release the artifact of the product.
+        """
+        artifact = self._artifact
+        self._artifact = None
+        if hasattr(artifact, "close"):
+            artifact.close()
+
 
 class Hdf4File(DataProductBase):
     """
     Base class for file products using HDF4File format. The :class:`Hdf4File`
     wraps around the pyhdf.SD class to implement RAII.
+
+    The names of the datasets in the file are read once when they are first
+    accessed. Vdatas and scientific datasets are attached on first access
+    and kept attached until the file is closed.
+
+    Views of a file created with :meth:`window` share the handles of the
+    file and restrict all reads performed through :meth:`_read` to a range
+    of profiles.
     """
+    # File suffixes of the product.
+    suffixes = [".hdf"]
+
     def __init__(self, filename):
         """
         Open an HDF4 file for reading.
@@ -35,30 +216,158 @@ class Hdf4File(DataProductBase):
         self.hdf = HDF(self.filename, HC.READ)
         self.vs = self.hdf.vstart()
         self.sd = SD(self.filename, SDC.READ)
+        self._vs_attributes = None
+        self._sd_attributes = None
+        self._interface_map = None
+        self._handles = {}
+        self._window = None
+        self._parent = None
 
     @property
     def vs_attributes(self):
-        vs_attributes = [t[0] for t in self.vs.vdatainfo()]
-        return vs_attributes
+        if self._vs_attributes is None:
+            self._vs_attributes = [t[0] for t in self.vs.vdatainfo()]
+        return self._vs_attributes
 
     @property
     def sd_attributes(self):
-        sd_attributes = [t for t in self.sd.datasets()]
-        return sd_attributes
+        if self._sd_attributes is None:
+            self._sd_attributes = [t for t in self.sd.datasets()]
+        return self._sd_attributes
 
     @property
     def attributes(self):
         return self.vs_attributes + self.sd_attributes
 
+    def _interfaces(self):
+        """
+        Dictionary mapping dataset names to the interface providing them.
+        """
+        if self._interface_map is None:
+            interfaces = dict([(name, self.sd) for name in self.sd_attributes])
+            interfaces.update([(name, self.vs) for name in self.vs_attributes])
+            self._interface_map = interfaces
+        return self._interface_map
+
     def __getitem__(self, name):
-        if name in self.vs_attributes:
-            return self.vs.attach(name)
-        elif name in self.sd_attributes:
-            return self.sd.select(name)
-        else:
-            raise ValueError("{} is not a known attribute of this file.")
+        if self.closed:
+            raise ValueError("Cannot read {} from closed file {}."
+                             .format(name, self.filename))
+        handle = self._handles.get(name)
+        if handle is None:
+            interface = self._interfaces().get(name)
+            if interface is self.vs:
+                handle = self.vs.attach(name)
+            elif interface is self.sd:
+                handle = self.sd.select(name)
+            else:
+                raise ValueError("{} is not a known attribute of this file."
+                                 .format(name))
+            self._handles[name] = handle
+        return handle
 
-    def __del__(self):
+    def _read(self, name, index=None):
+        """
+        Read dataset.
+
+        If the file is a view created with :meth:`window`, only the selected
+        profiles are read. Profiles are taken to run along the first axis
+        of the dataset whose length matches the number of profiles in the
+        file. Datasets without such an axis are read completely.
+
+        Arguments:
+            name(:code:`str`): The name of the dataset to read.
+            index(:code:`int`): If given, only this element along the first
+                axis of the dataset is read.
+
+        Returns:
+            :code:`numpy.ndarray` containing the data.
+        """
+        handle = self[name]
+        if self._interfaces()[name] is self.vs:
+            if self._window is None or handle.inquire()[0] != self._window[2]:
+                return np.array(handle[:])
+            start, stop, _ = self._window
+            return np.array(handle[start:stop])
+
+        if self._window is None and index is None:
+            return handle[:]
+        dimensions = handle.info()[2]
+        if not isinstance(dimensions, list):
+            dimensions = [dimensions]
+        start = [0] * len(dimensions)
+        count = list(dimensions)
+        if not index is None:
+            start[0], count[0] = index, 1
+        if not self._window is None:
+            i0, i1, n = self._window
+            for axis, length in enumerate(dimensions):
+                if length == n and not (axis == 0 and not index is None):
+                    start[axis], count[axis] = i0, i1 - i0
+                    break
+        data = handle.get(start=start, count=count)
+        if not index is None:
+            data = data[0]
+        return data
+
+    def window(self, start, stop, n_profiles):
+        """
+        Create a view of the file restricted to a range of profiles.
+
+        Arguments:
+            start(:code:`int`): Index of the first profile of the view,
+                relative to this file or view.
+            stop(:code:`int`): Index one past the last profile of the view.
+            n_profiles(:code:`int`): The number of profiles in the file.
+
+        Returns:
+            A shallow copy of this object whose reads are restricted to
+            the given profiles.
+        """
+        offset, end = 0, n_profiles
+        if not self._window is None:
+            offset, end, _ = self._window
+        start = offset + max(int(start), 0)
+        stop = offset + min(int(stop), end - offset)
+        if stop <= start:
+            raise ValueError("The selection does not contain any profiles.")
+        view = copy(self)
+        view._window = (start, stop, n_profiles)
+        view._parent = self
+        view._artifact = None
+        return view
+
+    @property
+    def closed(self):
+        parent = getattr(self, "_parent", None)
+        if not parent is None:
+            return parent.closed
+        return getattr(self, "hdf", None) is None
+
+    def close(self):
+        """
+        Close the file. Closing a file more than once has no effect. Closing
+        a view only releases its reference to the underlying file.
+        """
+        if self.closed:
+            return
+        if not getattr(self, "_parent", None) is None:
+            self.hdf = None
+            self._parent = None
+            return
+        field_cache.invalidate(os.path.abspath(self.filename))
+        # Handles are only attached after the interface map was built.
+        for name, handle in self._handles.items():
+            if self._interface_map[name] is self.vs:
+                handle.detach()
+            else:
+                handle.endaccess()
+        self._handles = {}
         self.sd.end()
         self.vs.end()
         self.hdf.close()
+        self.hdf = None
+        super().close()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,176 @@
+"""
+Decoding of scaled and masked integer fields.
+
+The functions in this module convert raw integer data to physical values
+using in-place operations, so that decoding a field allocates at most the
+output array and its mask. Both can be passed in to reuse buffers across
+files.
+"""
+import numpy as np
+import numpy.ma as ma
+
+def _buffer(out, shape, dtype, name):
+    """
+    Allocate output buffer or check the given one.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape:
+        raise ValueError("Shape {} of {} doesn't match shape {} of the data."
+                         .format(out.shape, name, shape))
+    return out
+
+def decode_mask(raw, fill_value=None, fill_max=None, out=None):
+    """
+    Compute mask of missing values.
+
+    Arguments:
+        raw(:code:`numpy.ndarray`): The raw data.
+        fill_value: Raw value indicating missing data.
+        fill_max: Raw values less than or equal to this value indicate
+            missing data.
+        out(:code:`numpy.ndarray`): Boolean array to write the mask to.
+
+    Returns:
+        Boolean array that is true for missing values or
+        :code:`numpy.ma.nomask` if no fill values are given.
+    """
+    if fill_value is None and fill_max is None:
+        return ma.nomask
+    mask = _buffer(out, raw.shape, np.bool_, "mask buffer")
+    if not fill_value is None:
+        np.equal(raw, fill_value, out=mask)
+        if not fill_max is None:
+            mask |= raw <= fill_max
+    else:
+        np.less_equal(raw, fill_max, out=mask)
+    return mask
+
+def decode(raw,
+           factor=None,
+           offset=None,
+           fill_value=None,
+           fill_max=None,
+           valid_range=None,
+           dtype=np.float32,
+           out=None,
+           mask_out=None):
+    """
+    Decode scaled integer data.
+
+    Values are computed as :code:`(raw - offset) / factor` and clipped
+    to the valid range.
+
+    Arguments:
+        raw(:code:`numpy.ndarray`): The raw data.
+        factor: Factor by which raw values are divided.
+        offset: Offset subtracted from raw values before scaling.
+        fill_value: Raw value indicating missing data.
+        fill_max: Raw values less than or equal to this value indicate
+            missing data.
+        valid_range: Tuple :code:`(min, max)` to clip the decoded values
+            to.
+        dtype: The type of the decoded values.
+        out(:code:`numpy.ndarray`): Array to write the decoded values to.
+            Must have the same shape as raw.
+        mask_out(:code:`numpy.ndarray`): Boolean array to write the mask
+            to.
+
+    Returns:
+        Masked array, which wraps out if given, containing the decoded
+        values.
+    """
+    data = _buffer(out, raw.shape, dtype, "output buffer")
+    mask = decode_mask(raw, fill_value, fill_max, out=mask_out)
+    np.copyto(data, raw, casting="unsafe")
+    if not offset is None:
+        data -= offset
+    if not factor is None:
+        data /= factor
+    if not valid_range is None:
+        np.clip(data, valid_range[0], valid_range[1], out=data)
+    return ma.masked_array(data, mask=mask, copy=False)
+
+class ScaledArray:
+    """
+    Compact representation of scaled integer data.
+
+    Holds the raw data and its mask and decodes values only when they
+    are requested. Slicing returns a :class:`ScaledArray` of the sliced
+    raw data.
+
+    Attributes:
+        raw(:code:`numpy.ndarray`): The raw data.
+        mask(:code:`numpy.ndarray`): The mask of missing values.
+    """
+    def __init__(self,
+                 raw,
+                 factor=None,
+                 offset=None,
+                 fill_value=None,
+                 fill_max=None,
+                 valid_range=None,
+                 dtype=np.float32,
+                 mask=None):
+        """
+        Arguments:
+            raw(:code:`numpy.ndarray`): The raw data.
+            factor, offset, fill_value, fill_max, valid_range, dtype:
+                Decoding parameters as for :func:`decode`.
+            mask(:code:`numpy.ndarray`): Mask of missing values. Computed
+                from the fill values if not given.
+        """
+        self.raw = raw
+        self.factor = factor
+        self.offset = offset
+        self.valid_range = valid_range
+        self.dtype = np.dtype(dtype)
+        if mask is None:
+            mask = decode_mask(raw, fill_value, fill_max)
+        self.mask = mask
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes + np.asarray(self.mask).nbytes
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, index):
+        mask = self.mask
+        if not mask is ma.nomask:
+            mask = mask[index]
+        return ScaledArray(self.raw[index],
+                           factor=self.factor,
+                           offset=self.offset,
+                           valid_range=self.valid_range,
+                           dtype=self.dtype,
+                           mask=mask)
+
+    def decode(self, out=None):
+        """
+        Decode values.
+
+        Arguments:
+            out(:code:`numpy.ndarray`): Array to write the decoded values to.
+
+        Returns:
+            Masked array containing the decoded values.
+        """
+        data = decode(self.raw,
+                      factor=self.factor,
+                      offset=self.offset,
+                      valid_range=self.valid_range,
+                      dtype=self.dtype,
+                      out=out)
+        return ma.masked_array(data.data, mask=self.mask, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.decode().data
+        if not dtype is None:
+            data = data.astype(dtype, copy=False)
+        return data
@@ -1,7 +1,11 @@
 import atexit
 import tempfile
 import os
-import zipfile
+import shutil
+
+from wxdata.readers.formats import (Decompressor, extract, get_decompressor,
+                                    register_decompressor)
+from wxdata.readers.cache import extraction_cache
 
 ################################################################################
 # Temporary file storage
@@ -9,30 +13,125 @@ import zipfile
 
 _folder = tempfile.TemporaryDirectory()
 
+# Archive members up to this size in bytes are decompressed into memory instead
+# of a temporary file, if the platform supports it. Disabled if 0.
+max_memory_bytes = 0
+
 ################################################################################
-# Zip file.
+# Archives
 ################################################################################
 
-class ZipReader():
+class ArchiveReader():
+    """
+    Archive extracted into a temporary folder.
+    """
     def __init__(self, filename):
-        with zipfile.ZipFile(filename, 'r') as zipf:
-            member = zipf.namelist()[0]
-            zipf.extract(member, path=_folder.name)
+        # Each archive is extracted into its own folder, so that archives
+        # with members of the same name can be open at the same time.
+        self.directory = tempfile.mkdtemp(dir=_folder.name)
+        member = extract(filename, self.directory)[0]
+        self.filename = os.path.join(self.directory, member)
 
-        self.filename = os.path.join(_folder.name, member)
+    def close(self):
+        """
+        Remove the extracted file.
+        """
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
 
     def __del__(self):
-        if os.path.exists(self.filename):
-            os.remove(self.filename)
+        self.close()
+
+# Alias of :class:`ArchiveReader`, which used to handle only zip files.
+ZipReader = ArchiveReader
+
+class MemoryReader(ArchiveReader):
+    """
+    Archive member decompressed into an anonymous in-memory file.
+
+    The file is made accessible through a symbolic link with the name of
+    the member, which points to the file descriptor of the in-memory file.
+    The link is only valid within the process that created it.
+    """
+    def __init__(self, filename, decompressor, member):
+        self.directory = tempfile.mkdtemp(dir=_folder.name)
+        self.fd = os.memfd_create(os.path.basename(member))
+        try:
+            with os.fdopen(os.dup(self.fd), "wb") as output:
+                decompressor.extract(filename, member, output)
+            self.filename = os.path.join(self.directory,
+                                         os.path.basename(member))
+            os.symlink("/proc/{}/fd/{}".format(os.getpid(), self.fd),
+                       self.filename)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        Release the in-memory file.
+        """
+        super().close()
+        fd, self.fd = getattr(self, "fd", None), None
+        if not fd is None:
+            os.close(fd)
 
 ################################################################################
 # Decompression.
 ################################################################################
 
-def decompress(filename):
-    _, ext = os.path.splitext(filename)
-    if ext[-3:] in ["zip", "ZIP"]:
-        artifact = ZipReader(filename)
-        return artifact.filename, artifact
-    else:
+def decompressed_size(filename):
+    """
+    Disk space required to decompress a file.
+
+    Arguments:
+        filename(:code:`str`): The file to decompress.
+
+    Returns:
+        The size of the decompressed file in bytes or 0 if the file isn't
+        compressed. If the size can't be determined without decompressing
+        the file, the size of the archive is returned.
+    """
+    decompressor = get_decompressor(filename)
+    if decompressor is None:
+        return 0
+    _, size = decompressor.first_member(filename)
+    if size is None:
+        size = os.path.getsize(filename)
+    return size
+
+def decompress(filename, memory_limit=None):
+    """
+    Decompress file if necessary.
+
+    If :data:`wxdata.readers.cache.extraction_cache` is enabled, archives
+    are extracted into the cache. Otherwise they are extracted into a
+    temporary folder or, if they are small enough, into memory.
+
+    Arguments:
+        filename(:code:`str`): The file to decompress.
+        memory_limit(:code:`int`): Files up to this size are decompressed
+            into memory. Defaults to :data:`max_memory_bytes`.
+
+    Returns:
+        Tuple containing the name of the decompressed file and an artifact
+        object, whose :code:`close` method must be called once the file is
+        no longer needed, or None if the file wasn't compressed.
+    """
+    decompressor = get_decompressor(filename)
+    if decompressor is None:
         return filename, None
+    if extraction_cache.enabled:
+        artifact = extraction_cache.get(filename)
+        return artifact.filename, artifact
+
+    if memory_limit is None:
+        memory_limit = max_memory_bytes
+    if memory_limit > 0 and hasattr(os, "memfd_create"):
+        member, size = decompressor.first_member(filename)
+        if not size is None and size <= memory_limit:
+            artifact = MemoryReader(filename, decompressor, member)
+            return artifact.filename, artifact
+
+    artifact = ArchiveReader(filename)
+    return artifact.filename, artifact
@@ -0,0 +1,327 @@
+"""
+Persistent cache of extracted archives.
+
+Without a cache, every call to :func:`wxdata.readers.decompress` extracts
+the archive into a temporary folder that is removed when the product is
+closed. The :class:`ExtractionCache` instead keeps extracted files in a
+cache directory, so that archives that are opened repeatedly, from the
+same or from different processes, are decompressed only once.
+
+Extracted files are identified by the path, size and modification time
+of the archive. While a product is open, its extracted file is pinned by
+a shared lock on a lock file next to the entry, which prevents other
+processes from evicting it. Entries are extracted into temporary folders
+and renamed into place, so that partially extracted files are never
+visible. The name of the extracted member is stored in the file
+:code:`.member` of each entry.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from wxdata.readers.formats import extract
+
+def file_fingerprint(filename):
+    """
+    Fingerprint of a file used to detect changes to it.
+
+    Arguments:
+        filename(:code:`str`): The file to fingerprint.
+
+    Returns:
+        Tuple containing size and modification time in nanoseconds of
+        the file.
+    """
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def remove_directory(path, ignore_errors=False):
+    """
+    Remove directory of a cache.
+
+    The directory is renamed before it is deleted, so that other processes
+    never see a partially deleted directory. Files that are still open or
+    mapped into memory remain valid after the directory was removed.
+
+    Arguments:
+        path(:code:`str`): The directory to remove.
+        ignore_errors(:code:`bool`): If false, an :code:`OSError` is
+            raised if the directory can't be renamed.
+    """
+    parent, name = os.path.split(path)
+    try:
+        trash = tempfile.mkdtemp(prefix=".removed-", dir=parent)
+    except OSError:
+        if ignore_errors:
+            return
+        raise
+    try:
+        os.rename(path, os.path.join(trash, name))
+    except OSError:
+        if not ignore_errors:
+            raise
+    finally:
+        shutil.rmtree(trash, ignore_errors=True)
+
+def _key(filename):
+    """
+    Key identifying the contents of an archive.
+    """
+    key = "{}:{}:{}".format(filename, *file_fingerprint(filename))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def _size(path):
+    """
+    Total size of the files below path.
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+class CachedFile:
+    """
+    Extracted file obtained from an :class:`ExtractionCache`.
+
+    The file is pinned in the cache until :meth:`close` is called.
+
+    Attributes:
+        filename(:code:`str`): The path of the extracted file.
+    """
+    def __init__(self, cache, key, filename):
+        self.cache = cache
+        self.key = key
+        self.filename = filename
+
+    def close(self):
+        """
+        Release the pin on the extracted file. The file remains in the
+        cache.
+        """
+        cache, self.cache = self.cache, None
+        if not cache is None:
+            cache._unpin(self.key)
+
+    def __del__(self):
+        self.close()
+
+class ExtractionCache:
+    """
+    Size-capped cache of extracted archives shared between processes.
+
+    The cache is disabled as long as no directory is set. When the total
+    size of the cache exceeds :code:`max_bytes`, the least recently used
+    entries that are not pinned by any process are removed.
+
+    Attributes:
+        directory(:code:`str`): The cache directory or None.
+        max_bytes(:code:`int`): The maximum total size of the cache.
+        hits(:code:`int`): The number of lookups that found an extracted
+            file.
+        misses(:code:`int`): The number of lookups that had to extract the
+            archive.
+        evictions(:code:`int`): The number of entries that were removed.
+    """
+    def __init__(self, directory=None, max_bytes=2 ** 34):
+        """
+        Arguments:
+            directory(:code:`str`): The cache directory or None.
+            max_bytes(:code:`int`): The maximum total size of the cache.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return not self.directory is None
+
+    @property
+    def stats(self):
+        """
+        Dictionary containing the cache statistics.
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "pinned": len(self._pins)}
+
+    def _lock_file(self, key):
+        return os.path.join(self.directory, key + ".lock")
+
+    def _pin(self, key):
+        """
+        Pin entry by acquiring a shared lock on its lock file. Pins are
+        reference-counted within the process.
+        """
+        import fcntl
+        with self._lock:
+            if key in self._pins:
+                self._pins[key][0] += 1
+                return
+
+        # The file lock is acquired without holding self._lock, since it
+        # may block while another thread evicts the entry.
+        path = self._lock_file(key)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            # The lock file may have been removed by an eviction while
+            # waiting for the lock.
+            try:
+                if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+        with self._lock:
+            if key in self._pins:
+                # Another thread pinned the entry concurrently. Its lock
+                # remains held when this descriptor is closed.
+                self._pins[key][0] += 1
+                os.close(fd)
+            else:
+                self._pins[key] = [1, fd]
+
+    def _unpin(self, key):
+        with self._lock:
+            pin = self._pins.get(key)
+            if pin is None:
+                return
+            pin[0] -= 1
+            if pin[0] == 0:
+                del self._pins[key]
+                os.close(pin[1])
+
+    def get(self, filename):
+        """
+        Get extracted file for archive.
+
+        Arguments:
+            filename(:code:`str`): Path of the archive.
+
+        Returns:
+            :class:`CachedFile` object pointing to the extracted file.
+        """
+        filename = os.path.abspath(filename)
+        os.makedirs(self.directory, exist_ok=True)
+        key = _key(filename)
+        entry = os.path.join(self.directory, key)
+        self._pin(key)
+        try:
+            member = self._member(entry)
+            if not member is None:
+                with self._lock:
+                    self.hits += 1
+                os.utime(entry)
+            else:
+                with self._lock:
+                    self.misses += 1
+                member = self._extract(filename, entry)
+                self._evict()
+        except BaseException:
+            self._unpin(key)
+            raise
+        return CachedFile(self, key, os.path.join(entry, member))
+
+    def _member(self, entry):
+        """
+        Name of the extracted member of an entry or None if the entry
+        doesn't exist.
+        """
+        try:
+            with open(os.path.join(entry, ".member")) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _extract(self, filename, entry):
+        """
+        Extract archive into temporary folder and rename it to the entry.
+
+        Returns:
+            The name of the extracted member.
+        """
+        temporary = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            member = extract(filename, temporary)[0]
+            with open(os.path.join(temporary, ".member"), "w") as f:
+                f.write(member)
+            os.chmod(temporary, 0o755)
+            try:
+                os.rename(temporary, entry)
+            except OSError:
+                # Another process extracted the archive concurrently.
+                if not os.path.isdir(entry):
+                    raise
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+        return member
+
+    def _evict(self):
+        """
+        Remove least recently used entries that aren't pinned until the
+        cache fits into :code:`max_bytes`.
+        """
+        import fcntl
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                used = entry.stat().st_mtime
+            except OSError:
+                continue
+            size = _size(entry.path)
+            entries.append((used, size, entry.name))
+            total += size
+
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path = self._lock_file(key)
+            evicted = False
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                remove_directory(os.path.join(self.directory, key))
+                os.remove(path)
+                evicted = True
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+            # self._lock is only taken after the file lock was released.
+            if evicted:
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries that aren't pinned from the cache.
+        """
+        if self.directory is None or not os.path.exists(self.directory):
+            return
+        max_bytes = self.max_bytes
+        self.max_bytes = -1
+        try:
+            self._evict()
+        finally:
+            self.max_bytes = max_bytes
+
+# Cache used by :func:`wxdata.readers.decompress`.
+extraction_cache = ExtractionCache()
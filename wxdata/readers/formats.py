@@ -0,0 +1,285 @@
+"""
+Registry of archive formats.
+
+Each supported format is described by a :class:`Decompressor`, which
+lists the members of an archive and streams their decompressed contents
+into a file. Decompressors are looked up by the suffix of the archive,
+and the most specific suffix wins, so that :code:`.tar.gz` files are
+handled by the tar decompressor and not by the gzip one. Further formats
+can be added with :func:`register_decompressor`.
+
+Data is decompressed in chunks of :data:`CHUNK_SIZE` bytes on a worker
+thread, while the calling thread writes the previous chunk to the
+output, so that decompression and disk writes overlap.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import struct
+import tarfile
+import threading
+import zipfile
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the chunks in which data is decompressed.
+CHUNK_SIZE = 4 * 2 ** 20
+
+def _copy(source, destination, chunk_size=CHUNK_SIZE):
+    """
+    Copy decompressed data from a file object to a file.
+
+    Chunks are read from source on a worker thread and written to
+    destination in the calling thread. At most two chunks are buffered.
+
+    Arguments:
+        source: File object to read the decompressed data from.
+        destination: Binary file object to write the data to.
+        chunk_size(:code:`int`): The number of bytes to read at once.
+    """
+    chunks = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                chunk = source.read(chunk_size)
+                chunks.put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e:
+            chunks.put(e)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if not chunk:
+                break
+            destination.write(chunk)
+    finally:
+        stop.set()
+        while reader.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader.join()
+
+class Decompressor(metaclass=ABCMeta):
+    """
+    Base class for archive formats.
+
+    Attributes:
+        suffixes(:code:`list`): The file suffixes of the format.
+        parallel(:code:`bool`): Whether members can be decompressed in
+            parallel.
+    """
+    suffixes = []
+    parallel = False
+
+    @abstractmethod
+    def members(self, filename):
+        """
+        The names of the files in an archive.
+        """
+        pass
+
+    def size(self, filename, member):
+        """
+        Size of a decompressed member or None if it is unknown.
+        """
+        return None
+
+    def first_member(self, filename):
+        """
+        Name and decompressed size of the first file in an archive. The
+        size is None if it is unknown.
+        """
+        member = self.members(filename)[0]
+        return member, self.size(filename, member)
+
+    @abstractmethod
+    def extract(self, filename, member, output):
+        """
+        Decompress member of archive.
+
+        Arguments:
+            filename(:code:`str`): The archive.
+            member(:code:`str`): The member to decompress.
+            output: Binary file object to write the decompressed data to.
+        """
+        pass
+
+class ZipDecompressor(Decompressor):
+    suffixes = [".zip"]
+    parallel = True
+
+    def members(self, filename):
+        with zipfile.ZipFile(filename, "r") as zipf:
+            return [i.filename for i in zipf.infolist() if not i.is_dir()]
+
+    def size(self, filename, member):
+        with zipfile.ZipFile(filename, "r") as zipf:
+            return zipf.getinfo(member).file_size
+
+    def extract(self, filename, member, output):
+        with zipfile.ZipFile(filename, "r") as zipf:
+            with zipf.open(member) as source:
+                _copy(source, output)
+
+class StreamDecompressor(Decompressor):
+    """
+    Single-file compression formats. The only member of the archive is the
+    file name without the compression suffix.
+    """
+    open = None
+
+    def members(self, filename):
+        name = os.path.basename(filename)
+        for suffix in self.suffixes:
+            if name.lower().endswith(suffix):
+                return [name[:-len(suffix)]]
+        return [name]
+
+    def extract(self, filename, member, output):
+        with type(self).open(filename, "rb") as source:
+            _copy(source, output)
+
+# Upper bound for the compression ratio of deflate streams.
+_MAX_DEFLATE_RATIO = 1032
+
+class GzipDecompressor(StreamDecompressor):
+    suffixes = [".gz"]
+    open = gzip.open
+
+    def size(self, filename, member):
+        # The size of the uncompressed data modulo 2 ** 32 is stored in the
+        # last four bytes of the file. It is only exact if the data can't
+        # exceed 2 ** 32 bytes, given the maximum compression ratio.
+        if os.path.getsize(filename) * _MAX_DEFLATE_RATIO >= 2 ** 32:
+            return None
+        with open(filename, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack("<I", f.read(4))[0]
+
+class Bzip2Decompressor(StreamDecompressor):
+    suffixes = [".bz2"]
+    open = bz2.open
+
+class XzDecompressor(StreamDecompressor):
+    suffixes = [".xz", ".lzma"]
+    open = lzma.open
+
+class TarDecompressor(Decompressor):
+    suffixes = [".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz",
+                ".txz"]
+
+    # Archives are read as streams, so that compressed archives are
+    # decompressed only up to the requested member.
+
+    def members(self, filename):
+        with tarfile.open(filename, "r|*") as tar:
+            return [m.name for m in tar if m.isfile()]
+
+    def _member(self, tar, member):
+        for m in tar:
+            if m.name == member:
+                return m
+        raise KeyError("{} is not a member of the archive.".format(member))
+
+    def size(self, filename, member):
+        with tarfile.open(filename, "r|*") as tar:
+            return self._member(tar, member).size
+
+    def first_member(self, filename):
+        with tarfile.open(filename, "r|*") as tar:
+            for m in tar:
+                if m.isfile():
+                    return m.name, m.size
+        raise IndexError("{} doesn't contain any files.".format(filename))
+
+    def extract(self, filename, member, output):
+        with tarfile.open(filename, "r|*") as tar:
+            _copy(tar.extractfile(self._member(tar, member)), output)
+
+# The registered decompressors.
+_decompressors = []
+
+def register_decompressor(decompressor):
+    """
+    Add archive format.
+
+    Arguments:
+        decompressor(:class:`Decompressor`): The decompressor handling the
+            format. It replaces previously registered decompressors for the
+            same suffixes.
+    """
+    _decompressors.insert(0, decompressor)
+
+def get_decompressor(filename):
+    """
+    Find decompressor for a file.
+
+    Arguments:
+        filename(:code:`str`): The name of the file.
+
+    Returns:
+        The :class:`Decompressor` for the file or None if the file isn't
+        an archive of a registered format.
+    """
+    name = filename.lower()
+    result, length = None, 0
+    for decompressor in _decompressors:
+        for suffix in decompressor.suffixes:
+            if name.endswith(suffix) and len(suffix) > length:
+                result, length = decompressor, len(suffix)
+    return result
+
+for decompressor in [ZipDecompressor(), GzipDecompressor(),
+                     Bzip2Decompressor(), XzDecompressor(), TarDecompressor()]:
+    register_decompressor(decompressor)
+
+def extract(filename, directory, members=None, workers=4):
+    """
+    Extract archive into a folder.
+
+    Arguments:
+        filename(:code:`str`): The archive.
+        directory(:code:`str`): The folder to extract the members to.
+        members(:code:`list`): The members to extract. Defaults to the
+            first member.
+        workers(:code:`int`): The number of members to decompress in
+            parallel, if the format allows it.
+
+    Returns:
+        The names of the extracted members relative to directory.
+    """
+    decompressor = get_decompressor(filename)
+    if decompressor is None:
+        raise ValueError("{} is not a known archive format.".format(filename))
+    if members is None:
+        members = [decompressor.first_member(filename)[0]]
+
+    def extract_member(member):
+        name = os.path.normpath(member).lstrip("/")
+        if name.startswith(".."):
+            raise ValueError("Member {} lies outside of the archive."
+                             .format(member))
+        path = os.path.join(directory, name)
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(path, "wb") as output:
+            decompressor.extract(filename, member, output)
+        return name
+
+    if decompressor.parallel and workers > 1 and len(members) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(extract_member, members))
+    return [extract_member(member) for member in members]